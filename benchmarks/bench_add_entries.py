@@ -0,0 +1,31 @@
+import time
+from itertools import islice
+
+from docx import Document
+
+from glossary.export_docx import add_entries, add_entries_xml, batch_size
+from glossary.reader import iter_glossary
+
+
+def bench(json_file='content/glossary.json', entries=700):
+    batch = list(islice(iter_glossary(json_file), entries))
+
+    start = time.perf_counter()
+    doc = Document()
+    for num, word, defs in batch:
+        add_entries(doc, num, word, defs)
+    elapsed = time.perf_counter() - start
+    print(f'add_entries:     {len(batch) / elapsed:8.0f} entries/s')
+    reference = doc.element.xml
+
+    start = time.perf_counter()
+    doc = Document()
+    for i in range(0, len(batch), batch_size):
+        add_entries_xml(doc, batch[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+    print(f'add_entries_xml: {len(batch) / elapsed:8.0f} entries/s')
+    print('identical document.xml:', doc.element.xml == reference)
+
+
+if __name__ == '__main__':
+    bench()
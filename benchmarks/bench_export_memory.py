@@ -0,0 +1,24 @@
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def bench(json_file='content/glossary.json', workers=1):
+    # run in a child process so that its peak RSS is not mixed with ours
+    with tempfile.TemporaryDirectory() as tmp:
+        code = f'from glossary import export_docx; export_docx({json_file!r}, {tmp!r}, workers={workers})'
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        elapsed = time.perf_counter() - start
+    # RUSAGE_CHILDREN reports the largest child: with a pool, that is the biggest volume's worker
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f'export_docx, workers={workers}: {elapsed:.1f}s, peak RSS {peak:.1f} MB')
+
+
+if __name__ == '__main__':
+    bench()
+    if os.cpu_count() > 1:
+        bench(workers=os.cpu_count())
@@ -0,0 +1,50 @@
+import time
+
+from glossary.format_unicode import bold, bold_char, convert, ital, ital_char, pipeline
+from glossary.reader import iter_glossary
+
+
+def bench(json_file='content/glossary.json'):
+    # real comment strings: every definition of the glossary
+    texts = [defnt for _, _, entries in iter_glossary(json_file) for _, defs in entries for defnt in defs]
+    size = sum(len(t) for t in texts) / 1e6
+    for name, style, style_char in [('ital', ital, ital_char), ('bold', bold, bold_char)]:
+        start = time.perf_counter()
+        chained = [''.join(map(style_char, t)) for t in texts]
+        chain_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        translated = [style(t) for t in texts]
+        table_time = time.perf_counter() - start
+
+        print(f'{name}: range chain {size / chain_time:6.2f} Mchar/s, translate {size / table_time:6.2f} Mchar/s '
+              f'(x{chain_time / table_time:.0f}), identical: {chained == translated}')
+
+
+def sequential(cmd, text):
+    # convert() as it was: one full pass per selected conversion
+    for names, conversion in pipeline:
+        if any(name in cmd for name in names):
+            text = conversion(text)
+    return text
+
+
+def bench_convert(json_file='content/glossary.json', cmds=('italbold', 'boldsans', 'boldfrak', 'wordcour')):
+    texts = [defnt for _, _, entries in iter_glossary(json_file) for _, defs in entries for defnt in defs]
+    size = sum(len(t) for t in texts) / 1e6
+    for cmd in cmds:
+        start = time.perf_counter()
+        passes = [sequential(cmd, t) for t in texts]
+        passes_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        compiled = [convert(cmd, t) for t in texts]
+        compiled_time = time.perf_counter() - start
+
+        print(f'convert {cmd}: sequential {size / passes_time:6.2f} Mchar/s, '
+              f'compiled {size / compiled_time:6.2f} Mchar/s, identical: {passes == compiled}')
+
+
+if __name__ == '__main__':
+    bench()
+    bench_convert()
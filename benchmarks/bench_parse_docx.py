@@ -0,0 +1,37 @@
+import tempfile
+import time
+from pathlib import Path
+
+from docx import Document
+
+from glossary.generate_csv_glossary import parse_docx
+
+
+def make_volume(out_file, entries):
+    doc = Document()
+    for num in range(1, entries + 1):
+        doc.add_heading(f'{num} བཀྲ་ཤིས་བདེ་ལེགས།', 2)
+        doc.add_heading('Termes utilisés', 4)
+        doc.add_paragraph('terme, autre terme')
+        doc.add_heading('Définition', 4)
+        doc.add_paragraph('une définition')
+        doc.add_paragraph('')
+        doc.add_heading('Notes', 4)
+        doc.add_paragraph('une note')
+        doc.add_heading('À consulter', 4)
+        doc.add_paragraph('Christian Steinert')
+    doc.save(out_file)
+
+
+def bench(sizes=(100, 200, 400, 800)):
+    for entries in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            make_volume(Path(tmp) / 'volume.docx', entries)
+            start = time.perf_counter()
+            parse_docx(tmp)
+            elapsed = time.perf_counter() - start
+        print(f'{entries:>6} entries: {elapsed:.3f}s ({elapsed / entries * 1000:.3f} ms/entry)')
+
+
+if __name__ == '__main__':
+    bench()
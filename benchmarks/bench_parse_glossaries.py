@@ -0,0 +1,23 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from glossary import parse_glossaries
+
+
+def bench(in_path='content', workers=os.cpu_count()):
+    outputs = {}
+    # parallel first: forked workers would otherwise inherit the serial run's in-memory cache
+    for n in sorted({1, workers}, reverse=True):
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            parse_glossaries(in_path, tmp, workers=n)
+            elapsed = time.perf_counter() - start
+            outputs[n] = (Path(tmp) / 'glossary.json').read_bytes()
+        print(f'workers={n}: {elapsed:.2f}s')
+    print('identical output:', len(set(outputs.values())) == 1)
+
+
+if __name__ == '__main__':
+    bench()
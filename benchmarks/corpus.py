@@ -0,0 +1,123 @@
+"""
+Synthetic corpora shaped like content/, at a multiple of its size.
+
+Headwords are new combinations of the syllables found in the shipped glossaries and definitions are
+drawn from the same file, so every stage goes through the same converters and tokenizers as on real data.
+"""
+import csv
+import random
+import re
+from pathlib import Path
+
+import pyewts
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+
+from glossary.export_docx import run_xml
+
+converter = pyewts.pyewts()
+wylie_syllable = re.compile(r"[A-Za-z'+.~?-]+")
+
+
+def generate_corpus(out_path, scale, in_path='content', seed=0, entries_per_volume=700):
+    """
+    Writes raw_glossaries/*.txt, spreadsheets/*.csv and volumes/*.docx under out_path, each scale times
+    the size of the shipped sources: the original lines, then (scale - 1) times as many synthetic ones.
+
+    :return: the number of lines, rows and docx entries written
+    """
+    out_path = Path(out_path)
+    rng = random.Random(seed)
+    raw_files = sorted((Path(in_path) / 'raw_glossaries').glob('*.txt'))
+    csv_files = sorted((Path(in_path) / 'spreadsheets').glob('*.csv'))
+    syllables = syllable_pool(raw_files)
+    taken = set()
+    sizes = {'lines': 0, 'rows': 0, 'entries': 0}
+    volume_entries = []
+
+    (out_path / 'raw_glossaries').mkdir(parents=True, exist_ok=True)
+    for in_file in raw_files:
+        pairs = [line.split('|') for line in in_file.read_text(encoding='utf8').split('\n') if line.count('|') == 1]
+        taken.update(word.strip() for word, _ in pairs)
+        lines = [f'{word}|{defnt}' for word, defnt in pairs]
+        for _ in range(len(pairs) * (scale - 1)):
+            word, defnt = new_word(syllables, rng, taken), rng.choice(pairs)[1]
+            lines.append(f'{word}|{defnt}')
+            volume_entries.append((word, defnt))
+        volume_entries.extend((word.strip(), defnt) for word, defnt in pairs)
+        (out_path / 'raw_glossaries' / in_file.name).write_text('\n'.join(lines), encoding='utf8')
+        sizes['lines'] += len(lines)
+
+    (out_path / 'spreadsheets').mkdir(parents=True, exist_ok=True)
+    for in_file in csv_files:
+        with in_file.open(newline='') as f:
+            header, *rows = list(csv.reader(f))
+        column = header.index('Tibétain')
+        entries = [row for row in rows if row and row[column].strip()]
+        rows += [new_row(entries, column, syllables, rng, taken) for _ in range(len(entries) * (scale - 1))]
+        with (out_path / 'spreadsheets' / in_file.name).open('w', newline='') as f:
+            csv.writer(f).writerows([header] + rows)
+        sizes['rows'] += len(rows)
+
+    volumes = out_path / 'volumes'
+    volumes.mkdir(parents=True, exist_ok=True)
+    for n, start in enumerate(range(0, len(volume_entries), entries_per_volume), 1):
+        write_volume(volumes / f'{n:04}.docx', volume_entries[start:start + entries_per_volume], start)
+    sizes['entries'] = len(volume_entries)
+    return sizes
+
+
+def syllable_pool(raw_files):
+    syllables = set()
+    for in_file in raw_files:
+        for line in in_file.read_text(encoding='utf8').split('\n'):
+            if line.count('|') == 1:
+                syllables.update(line.split('|')[0].split())
+    # leave out the stray punctuation of a few headwords: combined at random, it makes unparsable words
+    return sorted(s for s in syllables if wylie_syllable.fullmatch(s))
+
+
+def new_word(syllables, rng, taken):
+    while True:
+        word = ' '.join(rng.choices(syllables, k=rng.randint(2, 4)))
+        if word not in taken:
+            taken.add(word)
+            return word
+
+
+def new_row(entries, column, syllables, rng, taken):
+    row = list(rng.choice(entries))
+    row[column] = new_word(syllables, rng, taken)
+    return row
+
+
+def write_volume(out_file, entries, offset):
+    """
+    A volume as the translators edit them: a Heading 2 "num word" per entry, followed by the
+    Heading 4 sections that generate_csv reads, each with its paragraphs.
+    """
+    doc = Document()
+    heading_2 = doc.styles['Heading 2'].style_id
+    heading_4 = doc.styles['Heading 4'].style_id
+
+    def par(text, style=None):
+        ppr = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+        return f'<w:p>{ppr}{run_xml(text)}</w:p>'
+
+    xml = []
+    for num, (wylie, defnt) in enumerate(entries, offset + 1):
+        xml.append(par(f'{num} {converter.toUnicode(wylie)}', heading_2))
+        xml.append(par('Termes utilisés', heading_4))
+        xml.append(par(', '.join(d.strip() for d in defnt.split(',')[:3])))
+        xml.append(par('Définition', heading_4))
+        xml.append(par(defnt.strip()))
+        xml.append(par('Notes', heading_4))
+        xml.append(par(''))
+        xml.append(par('À consulter', heading_4))
+
+    fragment = parse_xml(f'<w:body {nsdecls("w")}>{"".join(xml)}</w:body>')
+    body = doc.element.body
+    pos = body.index(body.sectPr)
+    body[pos:pos] = list(fragment)
+    doc.save(out_file)
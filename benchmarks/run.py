@@ -0,0 +1,137 @@
+"""
+Times every pipeline stage on synthetic corpora at several multiples of the shipped content/ size:
+
+    python -m benchmarks.run --scales 1 10 100 --out benchmarks.json
+
+Results are comparable from one run to the next: same seed, same corpora, one JSON record per scale and stage.
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from glossary import export_docx, generate_csv, parse_glossaries
+from glossary.format_unicode import convert
+from glossary.generate_csv_glossary import segment_in_words, segmented
+from glossary.normalize import _normalize
+from glossary.reader import iter_entries
+
+from .corpus import generate_corpus
+
+
+@contextmanager
+def working_dir(path):
+    # export_docx reads and writes config.yaml in the working directory
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+# each run returns the number of items it processed: source lines, entries, headwords or definitions
+def run_parse_glossaries(corpus, out, sizes, workers):
+    # cold in-memory normalization cache and no on-disk cache: every headword is converted
+    _normalize.cache_clear()
+    parse_glossaries(corpus, out, workers=workers)
+    return sizes['lines'] + sizes['rows']
+
+
+def run_export_docx(corpus, out, sizes, workers):
+    store = out / 'glossary.sqlite'
+    (out / 'config.yaml').unlink(missing_ok=True)
+    with working_dir(out):
+        export_docx(store, out, workers=workers)
+    return sum(1 for _ in iter_entries(store))
+
+
+def run_generate_csv(corpus, out, sizes, workers):
+    generate_csv(corpus / 'volumes', out / 'glossary.csv')
+    return sizes['entries']
+
+
+def run_segment_in_words(corpus, out, sizes, workers):
+    # generate_csv has just segmented the same headwords: start from an empty memo
+    segmented.clear()
+    words = [word for _, word, _ in iter_entries(out / 'glossary.sqlite')]
+    for word in words:
+        segment_in_words(word)
+    return len(words)
+
+
+def run_convert(corpus, out, sizes, workers):
+    texts = [defnt for _, _, entries in iter_entries(out / 'glossary.sqlite') for _, defs in entries for defnt in defs]
+    for text in texts:
+        convert('italbold', text)
+    return len(texts)
+
+
+runs = {
+    'parse_glossaries': run_parse_glossaries,
+    'export_docx': run_export_docx,
+    'generate_csv': run_generate_csv,
+    'segment_in_words': run_segment_in_words,
+    'convert': run_convert,
+}
+stages = list(runs)
+
+
+def bench_scale(scale, work_dir, selected=stages, workers=1):
+    corpus = work_dir / 'corpus'
+    out = work_dir / 'out'
+    out.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    sizes = generate_corpus(corpus, scale, in_path=Path('content').resolve())
+    print(f'{scale}x corpus: {sizes} in {time.perf_counter() - start:.1f}s')
+
+    store = out / 'glossary.sqlite'
+    results = []
+    for name in selected:
+        if name != 'parse_glossaries' and not store.is_file():
+            results.append({'scale': scale, 'stage': name, 'error': 'no glossary: parse_glossaries was not run'})
+            continue
+        start = time.perf_counter()
+        try:
+            items = runs[name](corpus, out, sizes, workers)
+        except Exception as e:
+            # a stage missing its resources (e.g. botok data) should not hide the others
+            results.append({'scale': scale, 'stage': name, 'error': repr(e)})
+            print(f'{scale}x {name}: failed with {e!r}')
+            continue
+        seconds = time.perf_counter() - start
+        results.append({'scale': scale, 'stage': name, 'seconds': round(seconds, 3), 'items': items,
+                        'items_per_s': round(items / seconds, 1)})
+        print(f'{scale}x {name}: {seconds:.2f}s, {items} items, {items / seconds:.0f}/s')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline on scaled synthetic corpora.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--stages', nargs='+', choices=stages, default=stages)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--out', default='benchmarks.json', help='where the JSON results are written')
+    parser.add_argument('--keep', metavar='DIR', help='generate the corpora in DIR and keep them')
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        if args.keep:
+            work_dir = Path(args.keep).resolve() / f'{scale}x'
+            results.extend(bench_scale(scale, work_dir, args.stages, args.workers))
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                results.extend(bench_scale(scale, Path(tmp), args.stages, args.workers))
+
+    report = {'python': platform.python_version(), 'cpu_count': os.cpu_count(), 'workers': args.workers,
+              'results': results}
+    Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf8')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,23 @@
+import os
+
 from glossary import generate_csv
+from glossary.instrument import arg_parser, instrumented
+
+
+def volume_numbers(arg):
+    # "3" or "3-5"
+    first, _, last = arg.partition('-')
+    return range(int(first), int(last or first) + 1)
 
 
+parser = arg_parser('Generate content/glossary.csv from the docx volumes.')
+parser.add_argument('--volumes', nargs='+', type=volume_numbers, metavar='N[-M]',
+                    help='only export these volumes, by the number their file name starts with')
+parser.add_argument('--stream', action='store_true',
+                    help='write each volume as soon as it is parsed; entries repeated in a later volume are left out')
+args = parser.parse_args()
+volumes = {n for numbers in args.volumes for n in numbers} if args.volumes else None
 in_path = 'content/'
 csv_file = 'content/glossary.csv'
-generate_csv(in_path, csv_file)
+with instrumented('gen_csv', args.report, args.profile):
+    generate_csv(in_path, csv_file, volumes, workers=os.cpu_count(), stream=args.stream)
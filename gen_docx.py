@@ -1,5 +1,16 @@
+import os
+from pathlib import Path
+
 from glossary import export_docx
+from glossary.instrument import parse_args, instrumented
+from glossary.store import is_current
 
-in_file = 'content/glossary.json'
+args = parse_args('Export the merged glossary to docx volumes.')
+# the indexed store written by parse_glossaries is read lazily, unless glossary.json changed since:
+# then glossary.json is read instead
+json_file = Path('content/glossary.json')
+store_file = Path('content/glossary.sqlite')
+in_file = store_file if is_current(store_file, json_file) else json_file
 out_path = 'content'
-export_docx(in_file, out_path)
+with instrumented('gen_docx', args.report, args.profile):
+    export_docx(in_file, out_path, workers=os.cpu_count())
@@ -1,3 +1,33 @@
-from .gloss_parse import parse_glossaries
-from .export_docx import export_docx
-from .generate_csv_glossary import generate_csv
\ No newline at end of file
+import sys
+from importlib import import_module
+from types import ModuleType
+
+# the entry points are imported on first use, so that each script only loads the dependencies it needs:
+# botok for parse_glossaries and generate_csv, python-docx for export_docx and generate_csv
+lazy = {
+    'parse_glossaries': 'gloss_parse',
+    'export_docx': 'export_docx',
+    'generate_csv': 'generate_csv_glossary',
+}
+
+__all__ = list(lazy)
+
+
+class Package(ModuleType):
+    def __setattr__(self, name, value):
+        # importing a submodule binds its name in the package once it has run, whatever was bound before:
+        # the export_docx submodule would then hide the export_docx function, so the function is bound instead
+        if name in lazy and isinstance(value, ModuleType) and value.__name__ == f'{__name__}.{lazy[name]}':
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = Package
+
+
+def __getattr__(name):
+    if name not in lazy:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(f'.{lazy[name]}', __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,114 @@
+import posixpath
+import zipfile
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml.ns import qn
+from docx.styles import BabelFish
+from lxml import etree
+
+rels_ns = 'http://schemas.openxmlformats.org/package/2006/relationships'
+# text equivalents of the run content, as python-docx's run.text
+run_content = {qn('w:tab'): '\t', qn('w:ptab'): '\t', qn('w:cr'): '\n', qn('w:noBreakHyphen'): '-'}
+
+
+def iter_docx_paragraphs(docx_file):
+    """
+    Yields the (style name, text) of every paragraph of the document body, as Paragraph(p).style.name
+    and Paragraph(p).text would, without building python-docx's object model.
+
+    document.xml is streamed with iterparse and every paragraph is dropped once read, so memory does not
+    grow with the size of the volume.
+    """
+    with zipfile.ZipFile(docx_file) as package:
+        document = main_part(package)
+        styles, default = paragraph_styles(package, document)
+        body = qn('w:body')
+        with package.open(document) as f:
+            for _, p in etree.iterparse(f, tag=qn('w:p')):
+                parent = p.getparent()
+                # paragraphs in tables and text boxes are not part of the body, as for doc.element.body
+                if parent is None or parent.tag != body:
+                    continue
+                yield styles.get(paragraph_style_id(p), default), paragraph_text(p)
+                p.clear()
+                while p.getprevious() is not None:
+                    del parent[0]
+
+
+def paragraph_style_id(p):
+    ppr = p.find(qn('w:pPr'))
+    style = ppr.find(qn('w:pStyle')) if ppr is not None else None
+    return style.get(qn('w:val')) if style is not None else None
+
+
+def paragraph_text(p):
+    text = []
+    for child in p:
+        if child.tag == qn('w:r'):
+            run_text(child, text)
+        elif child.tag == qn('w:hyperlink'):
+            for run in child.iterchildren(qn('w:r')):
+                run_text(run, text)
+    return ''.join(text)
+
+
+def run_text(run, text):
+    for e in run:
+        if e.tag == qn('w:t'):
+            text.append(e.text or '')
+        elif e.tag == qn('w:br'):
+            # page and column breaks have no text equivalent
+            if e.get(qn('w:type'), 'textWrapping') == 'textWrapping':
+                text.append('\n')
+        elif e.tag in run_content:
+            text.append(run_content[e.tag])
+
+
+def paragraph_styles(package, document):
+    """
+    Maps the ids of the paragraph styles to their UI names ('heading 2' is shown as 'Heading 2'), once per volume.
+
+    :return: the map, and the name of the default paragraph style, used when a paragraph has no
+             style or a style that is not a paragraph style
+    """
+    styles_part = related_part(package, document, RT.STYLES)
+    if styles_part is None:
+        return {}, None
+
+    styles = {}
+    default = None
+    root = etree.fromstring(package.read(styles_part))
+    for style in root.iterchildren(qn('w:style')):
+        if style.get(qn('w:type')) != WD_STYLE_TYPE.PARAGRAPH.xml_value:
+            continue
+        name = style.find(qn('w:name'))
+        name = BabelFish.internal2ui(name.get(qn('w:val'))) if name is not None else None
+        # the first style with an id wins, as in python-docx
+        styles.setdefault(style.get(qn('w:styleId')), name)
+        # and the last default one
+        if style.get(qn('w:default')) in ('1', 'true', 'on'):
+            default = name
+    styles.pop(None, None)
+    styles.pop('', None)
+    return styles, default
+
+
+def main_part(package):
+    return related_part(package, '', RT.OFFICE_DOCUMENT)
+
+
+def related_part(package, source, rel_type):
+    """
+    Name in the zip file of the part related to source by rel_type, following source's relationships.
+    """
+    rels_file = posixpath.join(posixpath.dirname(source), '_rels', posixpath.basename(source) + '.rels')
+    if rels_file not in package.namelist():
+        return None
+    for rel in etree.fromstring(package.read(rels_file)).iterchildren(f'{{{rels_ns}}}Relationship'):
+        if rel.get('Type') == rel_type and rel.get('TargetMode') != 'External':
+            target = rel.get('Target')
+            if target.startswith('/'):
+                return target[1:]
+            return posixpath.normpath(posixpath.join(posixpath.dirname(source), target))
+    return None
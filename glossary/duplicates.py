@@ -0,0 +1,117 @@
+import json
+import math
+from collections import Counter
+from pathlib import Path
+
+
+# nominalizing particles, which end many headwords written with or without them (ཐག་བཅད / ཐག་བཅད་པ)
+particles = {'པ', 'བ', 'མ', 'པོ', 'བོ', 'མོ'}
+consonants = {chr(c) for c in range(0x0f40, 0x0f6d)}
+subjoined = {chr(c) for c in range(0x0f90, 0x0fbd)}
+vowels = {chr(c) for c in range(0x0f71, 0x0f7e)} | {'ྀ', 'ཱྀ'}
+aspirated = str.maketrans('ཁཆཐཕཚ', 'ཀཅཏཔཙ')
+post_suffixes = {'ས', 'ད'}
+# the smallest Jaccard similarity between the syllable bigrams of two headwords reported as duplicates
+threshold = 0.55
+
+
+def syllables(word):
+    return [syl for syl in word.strip().rstrip('།').split('་') if syl]
+
+
+def skeleton(syl):
+    """
+    The root letter, vowel and suffix of a syllable, without its prefix and post-suffix letters and with
+    the aspirated roots folded on the unaspirated ones: ཅིག and གཅིག, ཆད and བཅད, བབ and བབས are the same.
+    """
+    marks = [i for i, c in enumerate(syl) if c in vowels or c in subjoined]
+    if marks and marks[0] > 0:
+        # the root is the letter carrying the first vowel or subjoined letter
+        root = marks[0] - 1
+        end = root + 1
+        while end < len(syl) and (syl[end] in vowels or syl[end] in subjoined):
+            end += 1
+        suffix = [c for c in syl[end:] if c in consonants]
+    else:
+        letters = [c for c in syl if c in consonants]
+        if len(letters) == 3 and letters[1] in 'གངདནབམའརལས' and letters[2] in post_suffixes:
+            root = 0
+        else:
+            root = 1 if len(letters) >= 3 else 0
+        syl, end = ''.join(letters), root + 1
+        suffix = letters[end:]
+    if len(suffix) == 2 and suffix[1] in post_suffixes:
+        suffix = suffix[:1]
+    return (syl[root:end] + ''.join(suffix)).translate(aspirated)
+
+
+def tokens(word):
+    """
+    The syllable bigrams of a headword, over the skeletons of its syllables, between start and end markers.
+    """
+    syls = syllables(word)
+    while len(syls) > 1 and syls[-1] in particles:
+        syls.pop()
+    skeletons = ['^'] + [skeleton(syl) for syl in syls] + ['$']
+    return {(a, b) for a, b in zip(skeletons, skeletons[1:])}
+
+
+def find_duplicates(words):
+    """
+    Groups headwords that look like spelling variants of each other: the Jaccard similarity of their
+    syllable bigrams is at least threshold.
+
+    Candidate pairs come from an inverted index of the rarest bigrams of each headword (prefix filtering):
+    two headwords as similar as threshold always share one of them, so common bigrams are never scanned
+    and the time stays near-linear. Similar pairs are merged with a union-find.
+
+    :param words: the headwords
+    :return: clusters of at least two headwords, in the order of words
+    """
+    words = list(words)
+    word_tokens = {word: tokens(word) for word in words}
+    frequency = Counter(token for toks in word_tokens.values() for token in toks)
+
+    parent = {}
+
+    def find(word):
+        parent.setdefault(word, word)
+        while parent[word] != word:
+            parent[word] = parent[parent[word]]
+            word = parent[word]
+        return word
+
+    index = {}
+    for word in words:
+        toks = word_tokens[word]
+        rarest = sorted(toks, key=lambda token: (frequency[token], token))
+        prefix = rarest[:len(toks) - math.ceil(threshold * len(toks)) + 1]
+        candidates = set()
+        for token in prefix:
+            candidates.update(index.setdefault(token, []))
+            index[token].append(word)
+        for other in candidates:
+            other_toks = word_tokens[other]
+            common = len(toks & other_toks)
+            if common / (len(toks) + len(other_toks) - common) >= threshold:
+                root, other = find(word), find(other)
+                if other != root:
+                    parent[other] = root
+
+    clusters = {}
+    for word in words:
+        if word in parent:
+            clusters.setdefault(find(word), []).append(word)
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+
+def write_duplicates_report(total, out_file):
+    """
+    :param total: {num: (word, entries)}, as written to glossary.json
+    :param out_file: where the clusters are written, as lists of [num, word]
+    """
+    nums = {word: num for num, (word, _) in total.items()}
+    clusters = find_duplicates(nums)
+    report = [[[nums[word], word] for word in cluster] for cluster in clusters]
+    Path(out_file).write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding='utf8')
+    print(f'{len(report)} clusters of possible duplicates')
@@ -1,71 +1,237 @@
-import json
+import os
+import re
+from collections import deque
+from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
+from weakref import WeakKeyDictionary
+from xml.sax.saxutils import escape
 
 import yaml
 import docx
 from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
 import pyewts
-from tibetan_sort import TibetanSort
+
+from . import instrument
+from .instrument import stage, count
+from .reader import iter_entries
 
 converter = pyewts.pyewts()
-sorter = TibetanSort()
 
+steinert_url_parts = 'https://dictionary.christian-steinert.de/#%7B%22activeTerm%22%3A%22{word}%22%2C%22lang%22%3A%22tib%22%2C%22inputLang%22%3A%22tib%22%2C%22currentListTerm%22%3A%22{word}%22%2C%22forceLeftSideVisible%22%3Afalse%2C%22offset%22%3A0%7D'.split('{word}')
+hyperlink_factories = WeakKeyDictionary()
+batch_size = 100
+run_specials = re.compile('([\t\r\n])')
+link_rpr = '<w:rPr><w:color w:val="#0000EE"/></w:rPr>'
+bold_ital_rpr = '<w:rPr><w:b/><w:i/></w:rPr>'
+
+
+def export_docx(json_file, out_path, workers=1, fast=True):
+    config = parse_config(json_file)
+    ranges = resolve_volumes(json_file, config)
+    volumes = []
+    for vol_count, ((start, end), (first, last)) in enumerate(zip(config['start_ends'], ranges), 1):
+        volumes.append((first, last, volume_file(out_path, vol_count, start, end)))
+
+    # volumes are independent documents: render them in parallel if asked to
+    if workers > 1 and Path(json_file).suffix == '.sqlite':
+        # the store is indexed: every worker reads the range of its volume
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(render_store_volume, json_file, *volume, fast) for volume in volumes]
+            for future in futures:
+                instrument.merge(future.result())
+    elif workers > 1:
+        # glossary.json is decoded once, here, and each worker is sent the entries of its volume,
+        # at most workers volumes ahead of the one being rendered
+        with ProcessPoolExecutor(workers) as pool:
+            batches = iter_volume_entries(json_file, volumes)
+            pending = deque(pool.submit(render_volume, *batch, fast) for batch in islice(batches, workers))
+            while pending:
+                instrument.merge(pending.popleft().result())
+                for batch in islice(batches, 1):
+                    pending.append(pool.submit(render_volume, *batch, fast))
+    else:
+        for entries, out_file in iter_volume_entries(json_file, volumes, lazy=True):
+            render_volume(entries, out_file, fast)
+
+
+def iter_volume_entries(json_file, volumes, lazy=False):
+    """
+    Yields (entries, out_file) for each volume, in a single pass over the glossary: the ranges of
+    the volumes follow each other from the first entry.
+
+    :param lazy: yield the entries as an iterator to be consumed before the next volume, instead of a list
+    """
+    glossary = iter_entries(json_file)
+    for first, last, out_file in volumes:
+        entries = islice(glossary, last - first)
+        yield (entries if lazy else list(entries)), out_file
+
+
+def resolve_volumes(json_file, config):
+    """
+    Finds the range of entries of each volume: a volume goes on until its end headword, included.
+    """
+    ranges = []
+    words = (word for _, word, _ in iter_entries(json_file))
+    pos = 0
+    for start, end in config['start_ends']:
+        first = pos
+        for word in words:
+            pos += 1
+            if word == end:
+                break
+        ranges.append((first, pos))
+    return ranges
+
+
+def volume_file(out_path, vol_count, start, end):
+    s_name = start.split('་')
+    s_name = '་'.join(s_name) if len(s_name) <= 5 else '་'.join(s_name[:5]) + '[...]'
+    e_name = end.split('་')
+    e_name = '་'.join(e_name) if len(e_name) <= 5 else '་'.join(e_name[:5]) + '[...]'
+    return Path(out_path) / f'{vol_count} {s_name} — {e_name}.docx'
+
+
+def render_store_volume(store_file, first, last, out_file, fast=True):
+    return render_volume(iter_entries(store_file, first, last), out_file, fast)
+
+
+def render_volume(glossary, out_file, fast=True):
+    """
+    :param glossary: the (num, word, entries) of the volume, in sort order
+    :return: the instrument timings of the volume, for a pool worker to send back
+    """
+    timing = instrument.snapshot()
+    # entries are streamed, so only the volume being built is held in memory
+    with stage('render'):
+        doc = Document()
+        glossary = iter(glossary)
+        while True:
+            with stage('read'):
+                batch = list(islice(glossary, batch_size))
+            if not batch:
+                break
+            count('entries', len(batch))
+            if fast:
+                add_entries_xml(doc, batch)
+            else:
+                for num, word, entries in batch:
+                    add_entries(doc, num, word, entries)
+
+    # write next to the target, then rename, so an interrupted export never leaves a truncated volume
+    with stage('save'):
+        tmp_file = out_file.with_name(f'.{out_file.name}.tmp')
+        doc.save(tmp_file)
+        os.replace(tmp_file, out_file)
+    count('volumes')
+    return instrument.delta(timing)
+
+
+def add_entries(doc, current_entry, word, entries):
+    wylie = converter.toWylie(word)
+
+    doc.add_heading(f'{current_entry} {word}', 2)
+    doc.add_heading('Termes utilisés', 4)
+    doc.add_heading('Définition', 4)
+    doc.add_heading('Notes', 4)
+    doc.add_heading('À consulter', 4)
+    par = doc.add_paragraph()
+    add_hyperlink(par, steinert_url(wylie), 'Christian Steinert', '#0000EE', True)
+    par.add_run().add_break()
 
-def export_docx(json_file, out_path):
-    def add_entries(current_entry):
-        word, entries = data[str(current_entry)][0], data[str(current_entry)][1]
-        url = 'https://dictionary.christian-steinert.de/#%7B%22activeTerm%22%3A%22{word}%22%2C%22lang%22%3A%22tib%22%2C%22inputLang%22%3A%22tib%22%2C%22currentListTerm%22%3A%22{word}%22%2C%22forceLeftSideVisible%22%3Afalse%2C%22offset%22%3A0%7D'
+    e_num = 1
+    for name, entry in entries:
+        if e_num > 1:
+            name = f'\n{name}'
+        run = par.add_run(name + ' ')
+        run.font.bold = True
+        run.font.italic = True
+
+        d_num = 1
+        for n, defnt in enumerate(entry):
+            if d_num > 1:
+                defnt = f'\n⁃ {defnt}'
+            else:
+                defnt = f'⁃ {defnt}'
+            par.add_run(defnt)
+
+            d_num += 1
+        e_num += 1
+
+
+def add_entries_xml(doc, batch):
+    """
+    Fast path for add_entries(): the same paragraphs and runs are written as WordprocessingML from
+    string templates, then a whole batch of entries is parsed once and spliced into the body.
+
+    :param doc: the Document being built
+    :param batch: a list of (num, word, entries) tuples
+    """
+    heading_2 = doc.styles['Heading 2'].style_id
+    heading_4 = doc.styles['Heading 4'].style_id
+    sections = ''.join(f'<w:p><w:pPr><w:pStyle w:val="{heading_4}"/></w:pPr>{run_xml(title)}</w:p>'
+                       for title in ['Termes utilisés', 'Définition', 'Notes', 'À consulter'])
+
+    links = hyperlink_factory(doc.part, 'Christian Steinert', '#0000EE', True)
+
+    xml = []
+    for current_entry, word, entries in batch:
         wylie = converter.toWylie(word)
+        r_id = links.rel_id(steinert_url(wylie))
 
-        doc.add_heading(f'{current_entry} {word}', 2)
-        doc.add_heading('Termes utilisés', 4)
-        doc.add_heading('Définition', 4)
-        doc.add_heading('Notes', 4)
-        doc.add_heading('À consulter', 4)
-        par = doc.add_paragraph()
-        add_hyperlink(par, url.format(word=wylie), 'Christian Steinert', '#0000EE', True)
-        par.add_run().add_break()
+        xml.append(f'<w:p><w:pPr><w:pStyle w:val="{heading_2}"/></w:pPr>{run_xml(f"{current_entry} {word}")}</w:p>')
+        xml.append(sections)
+        xml.append(f'<w:p><w:hyperlink r:id="{r_id}">{run_xml("Christian Steinert", link_rpr)}</w:hyperlink>'
+                   '<w:r><w:br/></w:r>')
 
         e_num = 1
         for name, entry in entries:
             if e_num > 1:
                 name = f'\n{name}'
-            run = par.add_run(name + ' ')
-            run.font.bold = True
-            run.font.italic = True
+            xml.append(run_xml(name + ' ', bold_ital_rpr))
 
             d_num = 1
-            for n, defnt in enumerate(entry):
+            for defnt in entry:
                 if d_num > 1:
                     defnt = f'\n⁃ {defnt}'
                 else:
                     defnt = f'⁃ {defnt}'
-                par.add_run(defnt)
-
+                xml.append(run_xml(defnt))
                 d_num += 1
             e_num += 1
+        xml.append('</w:p>')
 
-    data = json.loads(Path(json_file).read_text())
-    config = parse_config(data)
-    current_entry = 1
-    vol_count = 1
-    for start, end in config['start_ends']:
-        doc = Document()
-        while current_entry <= len(data) and data[str(current_entry)][0] != end:
-            add_entries(current_entry)
-            current_entry += 1
-        else:
-            if current_entry <= len(data):
-                add_entries(current_entry)
-                current_entry += 1
-
-        s_name = start.split('་')
-        s_name = '་'.join(s_name) if len(s_name) <= 5 else '་'.join(s_name[:5]) + '[...]'
-        e_name = end.split('་')
-        e_name = '་'.join(e_name) if len(e_name) <= 5 else '་'.join(e_name[:5]) + '[...]'
-        out_file = Path(out_path) / f'{vol_count} {s_name} — {e_name}.docx'
-        doc.save(out_file)
-        vol_count += 1
+    fragment = parse_xml(f'<w:body {nsdecls("w", "r")}>{"".join(xml)}</w:body>')
+    body = doc.element.body
+    # paragraphs go before the final section properties, as in doc.add_paragraph()
+    pos = body.index(body.sectPr) if body.sectPr is not None else len(body)
+    body[pos:pos] = list(fragment)
+
+
+def run_xml(text, rpr=''):
+    """
+    A w:r element holding text, with the same content python-docx writes for run.text = text:
+    a w:t per stretch of text, w:tab for tabs and w:br for line breaks.
+    """
+    content = []
+    for chunk in run_specials.split(text):
+        if chunk == '\t':
+            content.append('<w:tab/>')
+        elif chunk in ['\r', '\n']:
+            content.append('<w:br/>')
+        elif chunk:
+            space = ' xml:space="preserve"' if len(chunk.strip()) < len(chunk) else ''
+            content.append(f'<w:t{space}>{escape(chunk)}</w:t>')
+    return f'<w:r>{rpr}{"".join(content)}</w:r>'
+
+
+def steinert_url(wylie):
+    return wylie.join(steinert_url_parts)
 
 
 def add_hyperlink(paragraph, url, text, color, underline):
@@ -77,44 +243,75 @@ def add_hyperlink(paragraph, url, text, color, underline):
     :param text: The text displayed for the url
     :return: The hyperlink object
     """
+    hyperlink = hyperlink_factory(paragraph.part, text, color, underline).create(url)
+    paragraph._p.append(hyperlink)
+    return hyperlink
 
-    # This gets access to the document.xml.rels file and gets a new relation id value
-    part = paragraph.part
-    r_id = part.relate_to(url, docx.opc.constants.RELATIONSHIP_TYPE.HYPERLINK, is_external=True)
 
-    # Create the w:hyperlink tag and add needed values
-    hyperlink = docx.oxml.shared.OxmlElement('w:hyperlink')
-    hyperlink.set(docx.oxml.shared.qn('r:id'), r_id, )
+def hyperlink_factory(part, text, color, underline):
+    factories = hyperlink_factories.setdefault(part, {})
+    key = (text, color, underline)
+    if key not in factories:
+        factories[key] = HyperlinkFactory(part, text, color, underline)
+    return factories[key]
 
-    # Create a w:r element
-    new_run = docx.oxml.shared.OxmlElement('w:r')
 
-    # Create a new w:rPr element
-    rPr = docx.oxml.shared.OxmlElement('w:rPr')
+class HyperlinkFactory:
+    """
+    Creates the hyperlinks of one document part: the w:hyperlink subtree is built once and deep-copied,
+    and identical urls share a single relationship id.
+    """
+    def __init__(self, part, text, color, underline):
+        self.part = part
+        self.rel_ids = {rel.target_ref: r_id for r_id, rel in part.rels.items()
+                        if rel.is_external and rel.reltype == RT.HYPERLINK}
+        self.next_rel = 1
 
-    # Add color if it is given
-    if not color is None:
-      c = docx.oxml.shared.OxmlElement('w:color')
-      c.set(docx.oxml.shared.qn('w:val'), color)
-      rPr.append(c)
+        # Create the w:hyperlink tag
+        hyperlink = docx.oxml.shared.OxmlElement('w:hyperlink')
 
-    # Remove underlining if it is requested
-    if not underline:
-      u = docx.oxml.shared.OxmlElement('w:u')
-      u.set(docx.oxml.shared.qn('w:val'), 'none')
-      rPr.append(u)
+        # Create a w:r element
+        new_run = docx.oxml.shared.OxmlElement('w:r')
 
-    # Join all the xml elements together add add the required text to the w:r element
-    new_run.append(rPr)
-    new_run.text = text
-    hyperlink.append(new_run)
+        # Create a new w:rPr element
+        rPr = docx.oxml.shared.OxmlElement('w:rPr')
 
-    paragraph._p.append(hyperlink)
+        # Add color if it is given
+        if not color is None:
+            c = docx.oxml.shared.OxmlElement('w:color')
+            c.set(docx.oxml.shared.qn('w:val'), color)
+            rPr.append(c)
 
-    return hyperlink
+        # Remove underlining if it is requested
+        if not underline:
+            u = docx.oxml.shared.OxmlElement('w:u')
+            u.set(docx.oxml.shared.qn('w:val'), 'none')
+            rPr.append(u)
+
+        # Join all the xml elements together add add the required text to the w:r element
+        new_run.append(rPr)
+        new_run.text = text
+        hyperlink.append(new_run)
+        self.template = hyperlink
+
+    def rel_id(self, url):
+        if url not in self.rel_ids:
+            # first free rId, like python-docx, without rescanning the relationships of every link
+            rels = self.part.rels
+            while f'rId{self.next_rel}' in rels:
+                self.next_rel += 1
+            r_id = f'rId{self.next_rel}'
+            rels.add_relationship(RT.HYPERLINK, url, r_id, is_external=True)
+            self.rel_ids[url] = r_id
+        return self.rel_ids[url]
+
+    def create(self, url):
+        hyperlink = deepcopy(self.template)
+        hyperlink.set(docx.oxml.shared.qn('r:id'), self.rel_id(url))
+        return hyperlink
 
 
-def parse_config(data):
+def parse_config(json_file):
     conf_file = Path('config.yaml')
     if not conf_file.is_file():
         template = {'entries_per_file': 700, 'start_ends': ''}
@@ -122,10 +319,11 @@ def parse_config(data):
 
     conf = yaml.safe_load(conf_file.read_text())
     if not conf['start_ends']:
-        starting_idx = list(range(1, len(data), conf['entries_per_file']))
-        starting_entries = [data[str(s)][0] for s in starting_idx]
-        ending_idx = list(range(conf['entries_per_file'], len(data), conf['entries_per_file'])) + [len(data)]
-        ending_entries = [data[str(e)][0] for e in ending_idx]
+        words = [word for _, word, _ in iter_entries(json_file)]
+        starting_idx = list(range(1, len(words), conf['entries_per_file']))
+        starting_entries = [words[s - 1] for s in starting_idx]
+        ending_idx = list(range(conf['entries_per_file'], len(words), conf['entries_per_file'])) + [len(words)]
+        ending_entries = [words[e - 1] for e in ending_idx]
         files = [[s, e] for s, e in zip(starting_entries, ending_entries)]
         conf['start_ends'] = files
         conf_file.write_text(yaml.safe_dump(conf, allow_unicode=True))
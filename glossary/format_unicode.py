@@ -4,9 +4,16 @@ from __future__ import print_function
 __copyright__ = "(C) 2021-2022 Guido U. Draheim, licensed under the APLv2"
 __version__ = "1.1.1017"
 
-from typing import List, Dict, Generator, Tuple
+from typing import Callable, List, Dict, Generator, TextIO, Tuple
+from functools import lru_cache, partial
 from io import StringIO
+from itertools import islice
+from operator import methodcaller
+import io
+import multiprocessing
+import re
 import sys
+import time
 import logging
 
 logg = logging.getLogger("UNICODER")
@@ -800,105 +807,126 @@ ital_base_encode: Dict[str, int] = {
 ital_base_lower: Dict[int, int] = {
     ital_base__h: ord('h')}
 
+def ital_char(c: str) -> str:
+    ch = ord(c)
+    if c in ital_base_encode:
+        return chr(ital_base_encode[c])
+    elif norm_base_A <= ch and ch <= norm_base_Z:
+        return chr(ital_base_A + (ch - norm_base_A))
+    elif norm_base_a <= ch and ch <= norm_base_z:
+        return chr(ital_base_a + (ch - norm_base_a))
+    elif norm_base_sz == ch:
+        return chr(ital_greek_a + 1)  # beta
+    elif bold_base_A <= ch and ch <= bold_base_Z:
+        return chr(bold_ital_base_A + (ch - bold_base_A))
+    elif bold_base_a <= ch and ch <= bold_base_z:
+        return chr(bold_ital_base_a + (ch - bold_base_a))
+    elif norm_sans_A <= ch and ch <= norm_sans_Z:
+        return chr(ital_sans_A + (ch - norm_sans_A))
+    elif norm_sans_a <= ch and ch <= norm_sans_z:
+        return chr(ital_sans_a + (ch - norm_sans_a))
+    elif bold_sans_A <= ch and ch <= bold_sans_Z:
+        return chr(bold_ital_sans_A + (ch - bold_sans_A))
+    elif bold_sans_a <= ch and ch <= bold_sans_z:
+        return chr(bold_ital_sans_a + (ch - bold_sans_a))
+    elif norm_greek_nabla == ch:
+        return chr(ital_greek_nabla)
+    elif norm_greek_diffs == ch:
+        return chr(ital_greek_diffs)
+    elif norm_greek_A <= ch and ch <= norm_greek_O:
+        return chr(ital_greek_A + (ch - norm_greek_A))
+    elif norm_greek_a <= ch and ch <= norm_greek_o:
+        return chr(ital_greek_a + (ch - norm_greek_a))
+    elif bold_greek_A <= ch and ch <= bold_greek_O + 1:
+        return chr(bold_ital_greek_A + (ch - bold_greek_A))
+    elif bold_greek_a <= ch and ch <= bold_greek_o + 1:
+        return chr(bold_ital_greek_a + (ch - bold_greek_a))
+    else:
+        return c
+
+def bold_char(c: str) -> str:
+    ch = ord(c)
+    if norm_base_A <= ch and ch <= norm_base_Z:
+        return chr(bold_base_A + (ch - norm_base_A))
+    elif norm_base_a <= ch and ch <= norm_base_z:
+        return chr(bold_base_a + (ch - norm_base_a))
+    elif norm_base_0 <= ch and ch <= norm_base_9:
+        return chr(bold_base_0 + (ch - norm_base_0))
+    elif norm_base_sz == ch:
+        return chr(bold_greek_a + 1)
+    elif ch in ital_base_lower:
+        return chr(bold_ital_base_a + (ital_base_lower[ch] - norm_base_a))
+    elif ital_base_A <= ch and ch <= ital_base_Z:
+        return chr(bold_ital_base_A + (ch - ital_base_A))
+    elif ital_base_a <= ch and ch <= ital_base_z:
+        return chr(bold_ital_base_a + (ch - ital_base_a))
+    elif norm_sans_A <= ch and ch <= norm_sans_Z:
+        return chr(bold_sans_A + (ch - norm_sans_A))
+    elif norm_sans_a <= ch and ch <= norm_sans_z:
+        return chr(bold_sans_a + (ch - norm_sans_a))
+    elif norm_sans_0 <= ch and ch <= norm_sans_9:
+        return chr(bold_sans_0 + (ch - norm_sans_0))
+    elif ital_sans_A <= ch and ch <= ital_sans_Z:
+        return chr(bold_ital_sans_A + (ch - ital_sans_A))
+    elif ital_sans_a <= ch and ch <= ital_sans_z:
+        return chr(bold_ital_sans_a + (ch - ital_sans_a))
+    elif ch in norm_fraktur_upper:
+        return chr(bold_fraktur_A + (norm_fraktur_upper[ch] - norm_base_A))
+    elif norm_fraktur_A <= ch and ch <= norm_fraktur_Y:
+        return chr(bold_fraktur_A + (ch - norm_fraktur_A))
+    elif norm_fraktur_a <= ch and ch <= norm_fraktur_z:
+        return chr(bold_fraktur_a + (ch - norm_fraktur_a))
+    elif ch in norm_script_upper:
+        return chr(bold_script_A + (norm_script_upper[ch] - norm_base_A))
+    elif ch in norm_script_lower:
+        return chr(bold_script_a + (norm_script_lower[ch] - norm_base_a))
+    elif norm_script_A <= ch and ch <= norm_script_Z:
+        return chr(bold_script_A + (ch - norm_script_A))
+    elif norm_script_a <= ch and ch <= norm_script_z:
+        return chr(bold_script_a + (ch - norm_script_a))
+    elif norm_greek_nabla == ch:
+        return chr(bold_greek_nabla)
+    elif norm_greek_diffs == ch:
+        return chr(bold_greek_diffs)
+    elif norm_greek_A <= ch and ch <= norm_greek_O:
+        return chr(bold_greek_A + (ch - norm_greek_A))
+    elif norm_greek_a <= ch and ch <= norm_greek_o:
+        return chr(bold_greek_a + (ch - norm_greek_a))
+    elif ital_greek_A <= ch and ch <= ital_greek_O + 1:
+        return chr(bold_ital_greek_A + (ch - ital_greek_A))
+    elif ital_greek_a <= ch and ch <= ital_greek_o + 1:
+        return chr(bold_ital_greek_a + (ch - ital_greek_a))
+    else:
+        return c
+
+# the charwise conversions only touch latin, greek, spaces, letterlike symbols, math operators and math alphanumerics
+style_ranges: List[Tuple[int, int]] = [
+    (0x0000, 0x03FF),
+    (0x2000, 0x206F),
+    (0x2100, 0x214F),
+    (0x2200, 0x22FF),
+    (0x1D400, 0x1D7FF)]
+
+def compile_table(style_char: Callable[[str], str]) -> Dict[int, str]:
+    """ precompute the per-character style function as a str.translate table """
+    table: Dict[int, str] = {}
+    for lo, hi in style_ranges:
+        for ch in range(lo, hi + 1):
+            mapped = style_char(chr(ch))
+            if mapped != chr(ch):
+                table[ch] = mapped
+    return table
+
+ital_table = compile_table(ital_char)
+bold_table = compile_table(bold_char)
+
 def ital(text: str) -> str:
     logg.debug("apply slant to ascii/black letters")
-    out = StringIO()
-    for c in text:
-        ch = ord(c)
-        if c in ital_base_encode:
-            out.write(chr(ital_base_encode[c]))
-        elif norm_base_A <= ch and ch <= norm_base_Z:
-            out.write(chr(ital_base_A + (ch - norm_base_A)))
-        elif norm_base_a <= ch and ch <= norm_base_z:
-            out.write(chr(ital_base_a + (ch - norm_base_a)))
-        elif norm_base_sz == ch:
-            out.write(chr(ital_greek_a + 1))  # beta
-        elif bold_base_A <= ch and ch <= bold_base_Z:
-            out.write(chr(bold_ital_base_A + (ch - bold_base_A)))
-        elif bold_base_a <= ch and ch <= bold_base_z:
-            out.write(chr(bold_ital_base_a + (ch - bold_base_a)))
-        elif norm_sans_A <= ch and ch <= norm_sans_Z:
-            out.write(chr(ital_sans_A + (ch - norm_sans_A)))
-        elif norm_sans_a <= ch and ch <= norm_sans_z:
-            out.write(chr(ital_sans_a + (ch - norm_sans_a)))
-        elif bold_sans_A <= ch and ch <= bold_sans_Z:
-            out.write(chr(bold_ital_sans_A + (ch - bold_sans_A)))
-        elif bold_sans_a <= ch and ch <= bold_sans_z:
-            out.write(chr(bold_ital_sans_a + (ch - bold_sans_a)))
-        elif norm_greek_nabla == ch:
-            out.write(chr(ital_greek_nabla))
-        elif norm_greek_diffs == ch:
-            out.write(chr(ital_greek_diffs))
-        elif norm_greek_A <= ch and ch <= norm_greek_O:
-            out.write(chr(ital_greek_A + (ch - norm_greek_A)))
-        elif norm_greek_a <= ch and ch <= norm_greek_o:
-            out.write(chr(ital_greek_a + (ch - norm_greek_a)))
-        elif bold_greek_A <= ch and ch <= bold_greek_O + 1:
-            out.write(chr(bold_ital_greek_A + (ch - bold_greek_A)))
-        elif bold_greek_a <= ch and ch <= bold_greek_o + 1:
-            out.write(chr(bold_ital_greek_a + (ch - bold_greek_a)))
-        else:
-            out.write(c)
-    return out.getvalue()
+    return text.translate(ital_table)
 
 def bold(text: str) -> str:
     logg.debug("apply fat to ascii/black letters")
-    out = StringIO()
-    for c in text:
-        ch = ord(c)
-        if norm_base_A <= ch and ch <= norm_base_Z:
-            out.write(chr(bold_base_A + (ch - norm_base_A)))
-        elif norm_base_a <= ch and ch <= norm_base_z:
-            out.write(chr(bold_base_a + (ch - norm_base_a)))
-        elif norm_base_0 <= ch and ch <= norm_base_9:
-            out.write(chr(bold_base_0 + (ch - norm_base_0)))
-        elif norm_base_sz == ch:
-            out.write(chr(bold_greek_a + 1))
-        elif ch in ital_base_lower:
-            out.write(chr(bold_ital_base_a + (ital_base_lower[ch] - norm_base_a)))
-        elif ital_base_A <= ch and ch <= ital_base_Z:
-            out.write(chr(bold_ital_base_A + (ch - ital_base_A)))
-        elif ital_base_a <= ch and ch <= ital_base_z:
-            out.write(chr(bold_ital_base_a + (ch - ital_base_a)))
-        elif norm_sans_A <= ch and ch <= norm_sans_Z:
-            out.write(chr(bold_sans_A + (ch - norm_sans_A)))
-        elif norm_sans_a <= ch and ch <= norm_sans_z:
-            out.write(chr(bold_sans_a + (ch - norm_sans_a)))
-        elif norm_sans_0 <= ch and ch <= norm_sans_9:
-            out.write(chr(bold_sans_0 + (ch - norm_sans_0)))
-        elif ital_sans_A <= ch and ch <= ital_sans_Z:
-            out.write(chr(bold_ital_sans_A + (ch - ital_sans_A)))
-        elif ital_sans_a <= ch and ch <= ital_sans_z:
-            out.write(chr(bold_ital_sans_a + (ch - ital_sans_a)))
-        elif ch in norm_fraktur_upper:
-            out.write(chr(bold_fraktur_A + (norm_fraktur_upper[ch] - norm_base_A)))
-        elif norm_fraktur_A <= ch and ch <= norm_fraktur_Y:
-            out.write(chr(bold_fraktur_A + (ch - norm_fraktur_A)))
-        elif norm_fraktur_a <= ch and ch <= norm_fraktur_z:
-            out.write(chr(bold_fraktur_a + (ch - norm_fraktur_a)))
-        elif ch in norm_script_upper:
-            out.write(chr(bold_script_A + (norm_script_upper[ch] - norm_base_A)))
-        elif ch in norm_script_lower:
-            out.write(chr(bold_script_a + (norm_script_lower[ch] - norm_base_a)))
-        elif norm_script_A <= ch and ch <= norm_script_Z:
-            out.write(chr(bold_script_A + (ch - norm_script_A)))
-        elif norm_script_a <= ch and ch <= norm_script_z:
-            out.write(chr(bold_script_a + (ch - norm_script_a)))
-        elif norm_greek_nabla == ch:
-            out.write(chr(bold_greek_nabla))
-        elif norm_greek_diffs == ch:
-            out.write(chr(bold_greek_diffs))
-        elif norm_greek_A <= ch and ch <= norm_greek_O:
-            out.write(chr(bold_greek_A + (ch - norm_greek_A)))
-        elif norm_greek_a <= ch and ch <= norm_greek_o:
-            out.write(chr(bold_greek_a + (ch - norm_greek_a)))
-        elif ital_greek_A <= ch and ch <= ital_greek_O + 1:
-            out.write(chr(bold_ital_greek_A + (ch - ital_greek_A)))
-        elif ital_greek_a <= ch and ch <= ital_greek_o + 1:
-            out.write(chr(bold_ital_greek_a + (ch - ital_greek_a)))
-        else:
-            out.write(c)
-    return out.getvalue()
+    return text.translate(bold_table)
 
 
 class Scanned:
@@ -906,9 +934,13 @@ class Scanned:
     cmd: str = ""
     verbose: int = 0
     helpinfo: int = 0
+    stream: int = 0
+    jobs: int = 1
+    files: List[str] = []
 
 def scan(args: List[str]) -> Scanned:
     opt = Scanned()
+    opt.files = []
     stopped = False
     for arg in args:
         if arg.startswith("-") and not stopped:
@@ -917,12 +949,17 @@ def scan(args: List[str]) -> Scanned:
                     opt.verbose += 1
                 elif arg.startswith("--help"):
                     opt.helpinfo += 1
+                elif arg.startswith("--stream"):
+                    opt.stream += 1
+                elif arg.startswith("--jobs="):
+                    opt.jobs = int(arg[len("--jobs="):])
                 else:
                     print("unknown option {arg} (ignored)".format(**locals()), file=sys.stderr)
             else:
-                accept = "hv"
+                accept = "hvs"
                 opt.verbose += arg.count("v")
                 opt.helpinfo += arg.count("h")
+                opt.stream += arg.count("s")
                 for a in arg[1:]:
                     if a not in accept:
                         print("unknown option -{a} (ignored)".format(**locals()), file=sys.stderr)
@@ -930,7 +967,9 @@ def scan(args: List[str]) -> Scanned:
             if not opt.cmd:
                 opt.cmd = arg
                 stopped = True
-            elif not opt.text:
+                continue
+            opt.files.append(arg)
+            if not opt.text:
                 opt.text = arg
             else:
                 opt.text += " " + arg
@@ -941,45 +980,120 @@ def convert(cmd: str, text: str) -> str:
         text = cmd + " " + text
         cmd = "value"
     logg.debug("cmd = '%s'", cmd)
-    if "nobr" in cmd or "word" in cmd:
-        text = nobrspace(text)
-    if "thin" in cmd or "value" in cmd:
-        text = thinspace(text)
-    if "button" in cmd or "button" in cmd:
-        text = button(text)
-    if "circ" in cmd or "circled" in cmd:
-        text = circled(text)
-    if "parens" in cmd or "parent" in cmd:
-        text = parens(text)
-    if "frac" in cmd or "value" in cmd:
-        text = fractions(text)
-    if "doub" in cmd or "wide" in cmd:
-        text = double(text)
-    if "caps" in cmd or "init" in cmd:
-        text = initial(text)
-    if "rune" in cmd or "futark" in cmd:
-        text = rune(text)
-    if "greek" in cmd or "math" in cmd:
-        text = greek(text)
-    if "black" in cmd or "frak" in cmd:
-        text = fraktur(text)
-    if "round" in cmd or "script" in cmd or "writ" in cmd:
-        text = script(text)
-    if "cour" in cmd or "type" in cmd or "mono" in cmd:
-        text = courier(text)
-    if "sans" in cmd or "vect" in cmd:
-        text = sans(text)
-    # and the variants in ital and bold
-    if "ital" in cmd or "name" in cmd or "slant" in cmd:
-        text = ital(text)
-    if "bold" in cmd or "fat" in cmd:
-        text = bold(text)
+    for step in compile_convert(cmd):
+        text = step(text)
     return text
 
+# the conversions of convert() in the order they are applied, with the cmd substrings selecting them
+pipeline: List[Tuple[Tuple[str, ...], Callable[[str], str]]] = [
+    (("nobr", "word"), nobrspace),
+    (("thin", "value"), thinspace),
+    (("button",), button),
+    (("circ", "circled"), circled),
+    (("parens", "parent"), parens),
+    (("frac", "value"), fractions),
+    (("doub", "wide"), double),
+    (("caps", "init"), initial),
+    (("rune", "futark"), rune),
+    (("greek", "math"), greek),
+    (("black", "frak"), fraktur),
+    (("round", "script", "writ"), script),
+    (("cour", "type", "mono"), courier),
+    (("sans", "vect"), sans),
+    # and the variants in ital and bold
+    (("ital", "name", "slant"), ital),
+    (("bold", "fat"), bold)]
+
+# conversions that map each character on its own, whatever its neighbours
+charwise: List[Callable[[str], str]] = [
+    thinspace, button, circled, parens, double, fraktur, script, courier, sans, ital, bold]
+
+nobr_after_digit = re.compile("(?<=[0-9]) ")
+
+@lru_cache(maxsize=None)
+def compile_convert(cmd: str) -> Tuple[Callable[[str], str], ...]:
+    """ turn cmd into its list of passes, where consecutive charwise conversions are fused in one table """
+    steps: List[Callable[[str], str]] = []
+    fused: List[Callable[[str], str]] = []
+    def flush() -> None:
+        if fused:
+            steps.append(methodcaller("translate", compose_tables([compile_table(f) for f in fused])))
+            fused.clear()
+    for names, conversion in pipeline:
+        if not any(name in cmd for name in names):
+            continue
+        if conversion is nobrspace:
+            # a space after a digit becomes a figure space, all the others a nobreak space
+            flush()
+            steps.append(lambda text: nobr_after_digit.sub(chr(norm_numm_space), text))
+            fused.append(lambda text: text.replace(" ", chr(norm_nobr_space)))
+        elif conversion in charwise:
+            fused.append(conversion)
+        else:
+            flush()
+            steps.append(conversion)
+    flush()
+    return tuple(steps)
+
+def compose_tables(tables: List[Dict[int, str]]) -> Dict[int, str]:
+    """ one table applying the given translate tables one after the other """
+    composed: Dict[int, str] = {}
+    for ch in set().union(*tables):
+        c = chr(ch)
+        for table in tables:
+            c = table.get(ord(c), c)
+        if c != chr(ch):
+            composed[ch] = c
+    return composed
+
+def convert_lines(cmd: str, lines: List[str]) -> str:
+    """ convert each line on its own, as if given on the command line, keeping the line ends """
+    out: List[str] = []
+    for line in lines:
+        text = line.rstrip("\r\n")
+        if text:
+            out.append(convert(cmd, text))
+        out.append(line[len(text):])
+    return "".join(out)
+
+def read_chunks(files: List[str], chunk_lines: int) -> Generator[List[str], None, None]:
+    for name in files or ["-"]:
+        if name == "-":
+            f = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+        else:
+            f = open(name, encoding="utf-8", newline="")
+        with f:
+            while True:
+                lines = list(islice(f, chunk_lines))
+                if not lines:
+                    break
+                yield lines
+
+def convert_stream(cmd: str, files: List[str], out: TextIO, jobs: int = 1, chunk_lines: int = 10000) -> None:
+    """ convert files (or stdin) line by line, in chunks of lines that may go to a pool of workers """
+    started = time.perf_counter()
+    size = 0
+    chunks = read_chunks(files, chunk_lines)
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            for converted in pool.imap(partial(convert_lines, cmd), chunks):
+                out.write(converted)
+                size += len(converted.encode("utf-8"))
+    else:
+        for lines in chunks:
+            converted = convert_lines(cmd, lines)
+            out.write(converted)
+            size += len(converted.encode("utf-8"))
+    out.flush()
+    elapsed = time.perf_counter() - started
+    logg.info("converted %.1f MB in %.2fs (%.1f MB/s)", size / 1e6, elapsed, size / 1e6 / max(elapsed, 1e-9))
+
 def helpinfo() -> str:
     return """unicoder [-options] command [text..]
     -h / --help       this help info
     -v / --verbose    increase logging level
+    -s / --stream     convert the lines of the files given instead of text (stdin if none or -)
+    --jobs=N          with --stream, convert chunks of lines in N worker processes
     command contains:
      *fat*  *bold*    convert to math fat symbols
      *ital* *name*    convert to math slanted symbols
@@ -1009,5 +1123,8 @@ if __name__ == "__main__":  # pragma: no cover
     logging.basicConfig(level=max(0, logging.WARNING - __opt.verbose * 10))
     if __opt.helpinfo:
         print(helpinfo())
+    elif __opt.stream:
+        __out = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="", write_through=False)
+        convert_stream(__opt.cmd, __opt.files, __out, __opt.jobs)
     else:
         print(convert(__opt.cmd, __opt.text))
\ No newline at end of file
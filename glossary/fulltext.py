@@ -0,0 +1,119 @@
+import math
+import re
+import unicodedata
+from array import array
+from collections import defaultdict
+
+# accents decomposed by NFKD (French accents, IAST diacritics): Tibetan vowel signs are left alone
+accents = re.compile('[\u0300-\u036f]')
+word_pattern = re.compile(r'\w+')
+
+# BM25 parameters
+k1 = 1.2
+b = 0.75
+
+
+def fold(text):
+    return accents.sub('', unicodedata.normalize('NFKD', text)).casefold()
+
+
+def tokenize(text):
+    return word_pattern.findall(fold(text))
+
+
+def entry_terms(entries):
+    """
+    {term: [positions]} over every definition of a headword. Definitions are one position apart
+    more than words are, so phrases never match across two of them.
+    """
+    terms = defaultdict(list)
+    pos = 0
+    for _, defs in entries:
+        for defnt in defs:
+            for term in tokenize(defnt):
+                terms[term].append(pos)
+                pos += 1
+            pos += 1
+    return terms, pos
+
+
+def build_fulltext(db, total):
+    """
+    Adds the inverted index of the definitions to the glossary store.
+
+    postings is clustered by term, so a query reads a few contiguous pages of the memory-mapped file.
+
+    :param db: connection to the store being written
+    :param total: {num: (word, entries)}, as written to glossary.json
+    """
+    db.execute('CREATE TABLE postings (term TEXT NOT NULL, num INTEGER NOT NULL, positions BLOB NOT NULL, '
+               'PRIMARY KEY (term, num)) WITHOUT ROWID')
+    db.execute('CREATE TABLE doc_lengths (num INTEGER PRIMARY KEY, length INTEGER NOT NULL)')
+    rows = []
+    lengths = []
+    for num, (_, entries) in total.items():
+        terms, length = entry_terms(entries)
+        lengths.append((num, length))
+        rows.extend((term, num, array('I', positions).tobytes()) for term, positions in terms.items())
+    rows.sort()
+    db.executemany('INSERT INTO postings VALUES (?, ?, ?)', rows)
+    db.executemany('INSERT INTO doc_lengths VALUES (?, ?)', lengths)
+
+
+def has_fulltext(db):
+    return db.execute("SELECT 1 FROM sqlite_master WHERE name = 'postings'").fetchone() is not None
+
+
+def search(db, query, limit=20):
+    """
+    Ranks headwords by the definitions matching query, folded like the index: accents and case are ignored.
+
+    Entries are scored with BM25 over the query terms, plus the score of the whole query as one more term
+    wherever its terms follow each other, so "pureté primordiale" ranks the exact phrase first.
+
+    :param db: a store opened with open_store()
+    :return: a list of (score, num, word), best first
+    """
+    phrase = tokenize(query)
+    terms = list(dict.fromkeys(phrase))
+    if not terms:
+        return []
+
+    nb_docs, total_length = db.execute('SELECT count(*), sum(length) FROM doc_lengths').fetchone()
+    avg_length = total_length / nb_docs if nb_docs else 0
+
+    postings = {}
+    lengths = {}
+    for term in terms:
+        postings[term] = {}
+        for num, blob, length in db.execute('SELECT num, positions, length FROM postings JOIN doc_lengths '
+                                            'USING (num) WHERE term = ?', (term,)):
+            positions = array('I')
+            positions.frombytes(blob)
+            postings[term][num] = positions
+            lengths[num] = length
+
+    idf = {t: math.log(1 + (nb_docs - len(p) + 0.5) / (len(p) + 0.5)) for t, p in postings.items()}
+    candidates = set().union(*postings.values())
+
+    def bm25(tf, num, weight):
+        norm = k1 * (1 - b + b * lengths[num] / avg_length)
+        return weight * tf * (k1 + 1) / (tf + norm)
+
+    scores = {}
+    for num in candidates:
+        score = sum(bm25(len(postings[t][num]), num, idf[t]) for t in terms if num in postings[t])
+        if len(phrase) > 1 and all(num in postings[t] for t in terms):
+            starts = set(postings[phrase[0]][num])
+            for offset, term in enumerate(phrase[1:], 1):
+                starts &= {p - offset for p in postings[term][num]}
+            if starts:
+                score += bm25(len(starts), num, sum(idf.values()))
+        scores[num] = score
+
+    best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    found = []
+    for num, score in best:
+        word, = db.execute('SELECT word FROM entries WHERE num = ?', (num,)).fetchone()
+        found.append((score, num, word))
+    return found
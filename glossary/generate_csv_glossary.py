@@ -1,27 +1,48 @@
 import csv
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
 
 from botok import Text
-from docx import Document
 from pyewts import pyewts
 
+from . import instrument
+from .docx_reader import iter_docx_paragraphs
 from .format_unicode import bold, ital
+from .instrument import stage, count
 
 converter = pyewts()
-
-
-def generate_csv(in_path, out_file):
-    parsed = parse_docx(in_path)
-    rows = parsed_2_rows(parsed)
-    with open(out_file, 'w', newline='') as csvfile:
+sections = {'Termes utilisés': 'words', 'Définition': 'def', 'Notes': 'notes'}
+affixed_particle = re.compile('([^།་_]) ([^_།་])')
+segmented = {}
+header = ['term', 'pos', 'comment', 'is_case_sensitive', 'fr']
+
+
+def generate_csv(in_path, out_file, volumes=None, workers=1, stream=False):
+    """
+    :param volumes: numbers of the volumes to export, as in "3 ཆོས་འཁོར། — ....docx", or None for all
+    :param workers: number of volumes parsed in parallel
+    :param stream: write the rows of each volume as soon as it is parsed, so only a few volumes are held
+                   in memory. An entry found again in a later volume is then reported and left out,
+                   instead of getting the sections of that volume appended.
+    """
+    with open(out_file, 'w', newline='', buffering=1 << 16) as csvfile:
         writer = csv.writer(csvfile, delimiter=',', quotechar='|')
-        for row in rows:
-            writer.writerow(row)
+        writer.writerow(header)
+        if stream:
+            glosses = iter_volumes(in_path, volumes, workers)
+        else:
+            glosses = [parse_docx(in_path, volumes, workers)]
+        for parsed in glosses:
+            count('entries', len(parsed))
+            with stage('serialize'):
+                writer.writerows(parsed_2_rows(parsed))
+                csvfile.flush()
 
 
 def parsed_2_rows(parsed):
-    rows = [['term', 'pos', 'comment', 'is_case_sensitive', 'fr']]
     for lemma, fields in parsed.items():
         cur_row = [''] * 5
         num, word = lemma
@@ -46,66 +67,168 @@ def parsed_2_rows(parsed):
         if len(fields['url']) < 500:
             cur_row[4] = fields['url']
 
-        rows.append(cur_row)
-    return rows
+        yield cur_row
 
 
-def parse_docx(in_path):
-    def add_section(num, section):
-        num += 1
-        par = doc.paragraphs[num]
+def parse_docx(in_path, volumes=None, workers=1):
+    gloss = {}
+    for _, parsed in parse_volumes(volume_files(in_path, volumes), workers):
+        merge_volume(gloss, parsed)
+    return gloss
+
 
-        if section not in gloss[cur_entry]:
-            gloss[cur_entry][section] = ['']
+def merge_volume(gloss, parsed):
+    """
+    Adds the entries of a volume to those of the previous ones, as if it had been parsed into gloss:
+    the first volume an entry is found in gives its url, the sections of the next ones are appended.
+    """
+    for entry, fields in parsed.items():
+        if entry not in gloss:
+            gloss[entry] = fields
+            continue
+        for section, texts in fields.items():
+            if section == 'url':
+                continue
+            if section not in gloss[entry]:
+                gloss[entry][section] = texts
+            else:
+                # every section of a volume starts with the '' parse_paragraphs opens it with
+                gloss[entry][section].extend(texts[1:])
+
+
+def iter_volumes(in_path, volumes=None, workers=1):
+    """
+    Yields the entries of each volume, in volume order, for generate_csv(stream=True).
+
+    An entry can only be completed by the volume it first appears in: the rows of the previous volumes
+    are already written, so it is reported and left out if it shows up again in a later one.
+    """
+    seen = set()
+    for file, gloss in parse_volumes(volume_files(in_path, volumes), workers):
+        for num, word in [entry for entry in gloss if entry in seen]:
+            print(f'{file.name}: {num} {word} already found in an earlier volume, left out')
+            del gloss[(num, word)]
+        seen.update(gloss)
+        yield gloss
+
+
+def parse_volumes(files, workers=1):
+    """
+    Yields (file, entries) for each volume, in the order of files.
+
+    With workers > 1, volumes are parsed in a process pool, at most workers of them ahead of the one
+    being consumed, so memory stays bounded whatever the number of volumes.
+    """
+    if workers <= 1 or len(files) <= 1:
+        for file in files:
+            yield file, parse_volume(file)[0]
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        files = iter(files)
+        pending = deque((file, pool.submit(parse_volume, file)) for file in islice(files, workers))
+        while pending:
+            file, future = pending.popleft()
+            gloss, timing = future.result()
+            instrument.merge(timing)
+            for next_file in islice(files, 1):
+                pending.append((next_file, pool.submit(parse_volume, next_file)))
+            yield file, gloss
+
+
+def parse_volume(file):
+    """
+    :return: the entries of a volume, and the instrument timings for a pool worker to send back
+    """
+    print(file.name)
+    timing = instrument.snapshot()
+    # reading is whatever parsing time is not spent in segment_words
+    with stage('read'):
+        gloss = parse_paragraphs(iter_docx_paragraphs(file), {})
+    count('volumes')
+    return gloss, instrument.delta(timing)
+
+
+def volume_files(in_path, volumes=None):
+    files = sorted(Path(in_path).glob('*.docx'))
+    if volumes is None:
+        return files
+    return [f for f in files if volume_number(f) in volumes]
+
+
+def volume_number(file):
+    number = file.name.split(' ', 1)[0].split('.', 1)[0]
+    return int(number) if number.isdigit() else None
+
+
+def parse_paragraphs(paragraphs, gloss):
+    # headwords are segmented once the volume is read, then entries are merged in document order
+    entries = read_entries(paragraphs)
+    with stage('tokenize'):
+        words = segment_words([word for _, word, _ in entries])
+
+    for (e_num, _, entry_sections), word in zip(entries, words):
+        cur_entry = tuple([e_num, word])
+        if cur_entry[0] and cur_entry not in gloss:
+            gloss[cur_entry] = {}
+            # add christian steinert url
+            url = 'https://dictionary.christian-steinert.de/#%7B%22activeTerm%22%3A%22{word}%22%2C%22lang%22%3A%22tib%22%2C%22inputLang%22%3A%22tib%22%2C%22currentListTerm%22%3A%22{word}%22%2C%22forceLeftSideVisible%22%3Afalse%2C%22offset%22%3A0%7D'
+            wylie = converter.toWylie(cur_entry[1])
+            wylie = wylie.replace('_', '').replace(' ', '%20')
+            url = url.format(word=wylie)
+            gloss[cur_entry]['url'] = url
+        for section, texts in entry_sections:
+            if section not in gloss[cur_entry]:
+                gloss[cur_entry][section] = ['']
+            gloss[cur_entry][section].extend(texts)
+    return gloss
 
-        while par.style.name != 'Heading 4':
-            gloss[cur_entry][section].append(par.text)
-            num += 1
-            par = doc.paragraphs[num]
-        num -= 1
-        return num
 
-    files = sorted(list(Path(in_path).glob('*.docx')))
-    gloss = {}
-    for file in files:
-        print(file.name)
-        doc = Document(file)
-        cur_entry = None
-        num = 0
-        while num < len(doc.paragraphs):
-            par = doc.paragraphs[num]
-            if not par.text:
-                num += 1
+def read_entries(paragraphs):
+    """
+    The entries of a volume in document order, as (e_num, headword, [(section, [paragraphs])]) tuples.
+    """
+    entries = []
+    section = None
+    for style, text in paragraphs:
+        # everything up to the next Heading 4 belongs to the current section
+        if section:
+            if style != 'Heading 4':
+                section[1].append(text)
                 continue
+            section = None
 
-            if par.style.name == 'Heading 2':
-                e_num, word = par.text.split(' ', 1)
-                word = segment_in_words(word)
-                cur_entry = tuple([e_num, word])
-                if cur_entry[0] and cur_entry not in gloss:
-                    gloss[cur_entry] = {}
-                    # add christian steinert url
-                    url = 'https://dictionary.christian-steinert.de/#%7B%22activeTerm%22%3A%22{word}%22%2C%22lang%22%3A%22tib%22%2C%22inputLang%22%3A%22tib%22%2C%22currentListTerm%22%3A%22{word}%22%2C%22forceLeftSideVisible%22%3Afalse%2C%22offset%22%3A0%7D'
-                    wylie = converter.toWylie(cur_entry[1])
-                    wylie = wylie.replace('_', '').replace(' ', '%20')
-                    url = url.format(word=wylie)
-                    gloss[cur_entry]['url'] = url
-            elif par.style.name == 'Heading 4':
-                if par.text == 'Termes utilisés':
-                    num = add_section(num, 'words')
-                elif par.text == 'Définition':
-                    num = add_section(num, 'def')
-                elif par.text == 'Notes':
-                    num = add_section(num, 'notes')
-            num += 1
-    return gloss
+        if not text:
+            continue
+
+        if style == 'Heading 2':
+            e_num, word = text.split(' ', 1)
+            entries.append((e_num, word, []))
+        elif style == 'Heading 4' and text in sections:
+            section = (sections[text], [])
+            entries[-1][2].append(section)
+    return entries
 
 
 def segment_in_words(string):
-    string = string.strip().rstrip('།').rstrip('་')
-    t = Text(string)
-    tokenized = t.tokenize_words_raw_text
+    return segment_words([string])[0]
+
+
+def segment_words(strings):
+    """
+    Segments headwords in words with botok, one distinct headword at a time.
+
+    Results are kept in segmented for the next headwords and volumes, so a headword is only tokenized once.
+    """
+    keys = [string.strip().rstrip('།').rstrip('་') for string in strings]
+    for key in dict.fromkeys(keys):
+        if key not in segmented:
+            segmented[key] = format_tokens(Text(key).tokenize_words_raw_text)
+    return [segmented[key] for key in keys]
+
+
+def format_tokens(tokenized):
     # format tokens
-    tokenized = re.sub('([^།་_]) ([^_།་])', '\g<1>␣\g<2>', tokenized)  # affixed particles
-    tokenized = re.sub('_', ' ', tokenized)  # spaces
+    tokenized = affixed_particle.sub(r'\g<1>␣\g<2>', tokenized)  # affixed particles
+    tokenized = tokenized.replace('_', '\u1680')  # spaces
     return tokenized
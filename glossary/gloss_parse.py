@@ -1,114 +1,270 @@
+import csv
+import hashlib
 import json
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from csv import DictReader
 
-import pyewts
-from botok import TokChunks
-from tibetan_sort import TibetanSort
+from .normalize import (normalize_word, stats, versions, open_cache, take_normalized, close_cache, save_cache,
+                        cache_report)
+from . import instrument
+from .duplicates import write_duplicates_report
+from .instrument import stage, count
+from .sort_keys import sort_words, number_words
+from .store import write_store
 
-converter = pyewts.pyewts()
-sorter = TibetanSort()
+Diagnostic = namedtuple('Diagnostic', ['file', 'line', 'message', 'text'])
+# cached partials are only valid for the normalization and the parsing code (csv_entry, columns...)
+# that produced them
+parser_versions = f'{versions}, gloss_parse {hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]}'
 
 
-def parse_glossaries(in_path, out_path):
-    # parse txt glossaries
-    joined = {}
-    gloss_txt = Path(in_path) / 'raw_glossaries'
-    for f in gloss_txt.glob('*.txt'):
-        print(f.name)
-        parse_bar_separated(f, joined)
+def parse_glossaries(in_path, out_path, cache_path=None, workers=1, stable_ids=False, duplicates=False,
+                      fulltext=False, strict=False):
+    """
+    Malformed lines are reported with their file and line number once every source is parsed.
+    They are skipped, unless strict is True, in which case nothing is written.
 
-    # todo: parse spreadsheet glossary
-    gloss_csv = Path(in_path) / 'spreadsheets'
-    for f in gloss_csv.glob('*.csv'):
-        print(f.name)
-        parse_csv(f, joined)
+    :return: the diagnostics of the malformed lines, so that callers can fail once the glossary is written
+    """
+    cache_file = Path(cache_path) / 'normalize.sqlite' if cache_path else None
 
-    # sort content
-    total = {}
-    sorted_words = sorter.sort_list(joined.keys())
-    for num, word in enumerate(sorted_words):
-        entry = joined[word]
-        sorted_entry = [(k, entry[k]) for k in sorted(entry.keys())]
-        total[num+1] = (word, sorted_entry)
+    # txt glossaries first, then spreadsheets: the merge order is fixed whatever the number of workers
+    sources = sorted((Path(in_path) / 'raw_glossaries').glob('*.txt'))
+    sources += sorted((Path(in_path) / 'spreadsheets').glob('*.csv'))
+
+    # only re-parse the sources that changed since the last run
+    manifest = load_manifest(cache_path)
+    hashes = {f: source_hash(f) for f in sources}
+    partials = {}
+    for f in sources:
+        if manifest.get(source_key(f, in_path)) == hashes[f]:
+            partials[f] = load_partial(f, in_path, cache_path)
+    todo = [f for f in sources if partials.get(f) is None]
+    if len(todo) < len(sources):
+        print(f'{len(sources) - len(todo)} unchanged sources loaded from cache')
+
+    pooled = workers > 1 and len(todo) > 1
+    if pooled:
+        with ProcessPoolExecutor(workers, initializer=open_cache, initargs=(cache_file,)) as pool:
+            parsed = list(pool.map(parse_source, todo))
+    else:
+        open_cache(cache_file)
+        parsed = [parse_source(f) for f in todo]
+        close_cache()
+
+    cache_stats = dict.fromkeys(stats, 0)
+    diagnostics = []
+    new_normalized = []
+    for f, (partial, source_stats, source_diagnostics, timing, normalized) in zip(todo, parsed):
+        partials[f] = partial
+        new_normalized.extend(normalized)
+        if pooled:
+            instrument.merge(timing)
+        for k, v in source_stats.items():
+            cache_stats[k] += v
+        diagnostics.extend(source_diagnostics)
+        if cache_path:
+            save_partial(partial, f, in_path, cache_path)
+    # workers only read the normalization cache: what they normalized is written here, all at once
+    save_cache(cache_file, new_normalized)
+    # sources with errors stay out of the manifest, to be parsed and reported again until they are fixed
+    faulty = {d.file for d in diagnostics}
+    save_manifest({source_key(f, in_path): hashes[f] for f in sources if f.name not in faulty}, cache_path)
+    print(cache_report(cache_stats))
+
+    if diagnostics:
+        print('\n'.join(f'{d.file}:{d.line}: {d.message}: {d.text}' for d in diagnostics))
+        if strict:
+            exit(1)
 
+    with stage('merge'):
+        joined = {}
+        for f in sources:
+            for word, entry in partials[f].items():
+                if word not in joined:
+                    joined[word] = {}
+                for name, defs in entry.items():
+                    if name not in joined[word]:
+                        joined[word][name] = []
+                    joined[word][name].extend(defs)
+
+    # sort content
     out_file = Path(out_path) / 'glossary.json'
-    out_file.write_text(json.dumps(total, ensure_ascii=False), encoding='utf8')
+    index_file = Path(cache_path) / 'sort_index.json' if cache_path else None
+    with stage('sort'):
+        sorted_words = sort_words(joined.keys(), index_file)
+        previous = None
+        if stable_ids and out_file.is_file():
+            previous = {word: int(num) for num, (word, _) in json.loads(out_file.read_text(encoding='utf8')).items()}
+        numbers = number_words(sorted_words, previous)
+
+        total = {}
+        for word in sorted_words:
+            entry = joined[word]
+            sorted_entry = [(k, entry[k]) for k in sorted(entry.keys())]
+            total[numbers[word]] = (word, sorted_entry)
+    count('entries', len(total))
+
+    with stage('serialize'):
+        out_file.write_text(json.dumps(total, ensure_ascii=False), encoding='utf8')
+        write_store(total, Path(out_path) / 'glossary.sqlite', fulltext, out_file)
+    if duplicates:
+        with stage('duplicates'):
+            write_duplicates_report(total, Path(out_path) / 'glossary_duplicates.json')
+    return diagnostics
+
+
+def parse_source(in_file):
+    """
+    Parses a single glossary into its own {word: {source: [defs]}} map, so sources can be parsed in parallel.
+    Also returns the normalization cache counters, the diagnostics, the instrument timings and the
+    normalizations missing from the disk cache for that source.
+    """
+    print(in_file.name)
+    before = dict(stats)
+    timing = instrument.snapshot()
+    partial = {}
+    diagnostics = []
+    # reading is whatever parsing time is not spent converting and tokenizing
+    with stage('read'):
+        if in_file.suffix == '.csv':
+            parse_csv(in_file, partial)
+        else:
+            parse_bar_separated(in_file, partial, diagnostics)
+    count('sources')
+    return (partial, {k: v - before[k] for k, v in stats.items()}, diagnostics, instrument.delta(timing),
+            take_normalized())
+
+
+def source_key(in_file, in_path):
+    return in_file.relative_to(in_path).as_posix()
+
+
+def source_hash(in_file):
+    return hashlib.sha256(in_file.read_bytes()).hexdigest()
+
+
+def load_manifest(cache_path):
+    if not cache_path:
+        return {}
+    manifest_file = Path(cache_path) / 'manifest.json'
+    if not manifest_file.is_file():
+        return {}
+    manifest = json.loads(manifest_file.read_text(encoding='utf8'))
+    # partials normalized by another pyewts/botok or parsed by another version of this code are stale
+    if manifest.get('versions') != parser_versions:
+        return {}
+    return manifest['sources']
+
+
+def save_manifest(manifest, cache_path):
+    if not cache_path:
+        return
+    manifest_file = Path(cache_path) / 'manifest.json'
+    manifest_file.parent.mkdir(parents=True, exist_ok=True)
+    content = {'versions': parser_versions, 'sources': manifest}
+    manifest_file.write_text(json.dumps(content, ensure_ascii=False, indent=2), encoding='utf8')
+
+
+def partial_file(in_file, in_path, cache_path):
+    return Path(cache_path) / 'partials' / (source_key(in_file, in_path) + '.json')
+
+
+def load_partial(in_file, in_path, cache_path):
+    cached = partial_file(in_file, in_path, cache_path)
+    if not cached.is_file():
+        return None
+    return json.loads(cached.read_text(encoding='utf8'))
+
+
+def save_partial(partial, in_file, in_path, cache_path):
+    cached = partial_file(in_file, in_path, cache_path)
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    cached.write_text(json.dumps(partial, ensure_ascii=False), encoding='utf8')
+
+
+csv_columns = ['Tibétain', 'Sanskrit', 'Anglais', 'Sens racine Français', 'Autres termes rencontrés']
 
 
 def parse_csv(in_file, joined):
+    """
+    Parses a spreadsheet column by column: cells are stripped and rows filtered in bulk, and every distinct
+    Tibetan cell is normalized once, however many rows share it.
+    """
+    columns = read_columns(in_file, csv_columns)
+    tibetan = [cell.strip() for cell in columns['Tibétain']]
+    # empty rows and capitalised section rows (KA, KHA...) are not entries
+    rows = [i for i, word in enumerate(tibetan) if word and not word[0].isupper()]
+
+    words, others = [], []
+    for i in rows:
+        word, _, other = tibetan[i].partition('\n')
+        words.append(word)
+        others.append(other.strip())
+    normalized = {word: normalize_word(word) for word in dict.fromkeys(words)}
+
+    skrt, root_en, root_fr, alter = ([columns[name][i].strip() for i in rows] for name in csv_columns[1:])
+    for word, *cells in zip(words, others, skrt, root_fr, root_en, alter):
+        joined.setdefault(normalized[word], {})[in_file.stem] = [csv_entry(*cells)]
+
+
+def csv_entry(others, skrt, root_fr, root_en, alter):
+    entry = []
+    if others:
+        entry.append(others)
+    if skrt:
+        entry.append(skrt)
+    roots = [r for r in [root_fr, root_en] if r]
+    if roots:
+        entry.append(f'Sens racine: {", ".join(roots)}')
+    if alter:
+        entry.append(f'Alternatives: {alter}')
+    return '\n '.join(entry)
+
+
+def read_columns(in_file, names):
+    """
+    {name: [cells]} for the given columns of a spreadsheet, short rows padded with empty cells.
+    """
     with in_file.open(newline='') as csvfile:
-        reader = DictReader(csvfile)
-        for row in reader:
-            word = row['Tibétain'].strip()
-            if not word or word[0].isupper():
-                continue
-            others = ''
-            if '\n' in word:
-                word, others = word.split('\n', maxsplit=1)
-            others = others.strip()
-            word = converter.toUnicode(word)
-            word = '་'.join(TokChunks(word).get_syls())
-            word = add_shad(word)
-            skrt = row['Sanskrit'].strip()
-            root_en = row['Anglais'].strip()
-            root_fr = row['Sens racine Français'].strip()
-            alter = row['Autres termes rencontrés'].strip()
-            entry = []
-            if others:
-                entry.append(others)
-            if skrt:
-                entry.append(skrt)
-            roots = [r for r in [root_fr, root_en] if r]
-            if roots:
-                entry.append(f'Sens racine: {", ".join(roots)}')
-            if alter:
-                entry.append(f'Alternatives: {alter}')
-            entry = '\n '.join(entry)
-
-            if word not in joined:
-                joined[word] = {}
-            joined[word][in_file.stem] = [entry]
-
-
-def parse_bar_separated(in_file, joined):
-    sep = '|'
-    dump = in_file.read_text()
-    name = in_file.stem
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        indices = [header.index(name) for name in names]
+        rows = [row for row in reader if row]
+    return {name: [row[i] if i < len(row) else '' for row in rows] for name, i in zip(names, indices)}
 
-    # sanity check
-    mal_formed = []
 
-    for num, line in enumerate(dump.split('\n')):
-        if not line.strip():
-            continue
+def parse_bar_separated(in_file, joined, diagnostics):
+    name = in_file.stem
+    for word, defnt in iter_bar_separated(in_file, diagnostics):
+        # cleanup (TokChunks) and convert to unicode
+        word = normalize_word(word)
 
-        if line.count(sep) != 1:
-            mal_formed.append((num+1, line))
-        else:
-            word, defnt = [e.strip() for e in line.split(sep)]
+        if word not in joined:
+            joined[word] = {}
 
-            # cleanup (TokChunks) and convert to unicode
-            word = converter.toUnicode(word)
-            word = '་'.join(TokChunks(word).get_syls())
-            word = add_shad(word)
+        if name not in joined[word]:
+            joined[word][name] = []
 
-            if word not in joined:
-                joined[word] = {}
+        joined[word][name].append(defnt)
 
-            if name not in joined[word]:
-                joined[word][name] = []
 
-            joined[word][name].append(defnt)
-    if mal_formed:
-        print('\n'.join([': '.join(m) for m in mal_formed]))
-        exit(1)
+def iter_bar_separated(in_file, diagnostics, sep='|'):
+    """
+    Streams the (word, definition) pairs of a "word | definition" glossary, one line at a time.
 
+    Malformed lines are skipped and appended to diagnostics, so every error of every source can be reported at once.
+    """
+    with in_file.open(encoding='utf8') as f:
+        for num, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
 
-def add_shad(word):
-    if word.endswith('ང'):
-        return word + '་།'
-    elif word[-1] in ['ཀ', 'ག', 'ཤ']:
-        return word
-    else:
-        return word + '།'
+            if line.count(sep) != 1:
+                diagnostics.append(Diagnostic(in_file.name, num, f'expected one "{sep}"', line))
+                continue
+
+            word, defnt = [e.strip() for e in line.split(sep)]
+            yield word, defnt
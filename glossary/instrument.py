@@ -0,0 +1,116 @@
+import argparse
+import cProfile
+import json
+import os
+import platform
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+timers = defaultdict(float)
+counters = Counter()
+# time spent in the nested stages of each open stage
+open_stages = []
+
+
+@contextmanager
+def stage(name):
+    """
+    Adds the time spent in the block to the timer of stage name.
+
+    Time spent in a nested stage only counts for that stage, so the timers add up to the time instrumented.
+    """
+    start = time.perf_counter()
+    open_stages.append(0.0)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timers[name] += elapsed - open_stages.pop()
+        if open_stages:
+            open_stages[-1] += elapsed
+
+
+def count(name, n=1):
+    counters[name] += n
+
+
+def snapshot():
+    return dict(timers), dict(counters)
+
+
+def delta(before):
+    """
+    Timers and counters added since before = snapshot(), for a pool worker to send back with its result.
+    """
+    before_timers, before_counters = before
+    return ({k: v - before_timers.get(k, 0) for k, v in timers.items()},
+            {k: v - before_counters.get(k, 0) for k, v in counters.items()})
+
+
+def merge(worker_delta):
+    worker_timers, worker_counters = worker_delta
+    for k, v in worker_timers.items():
+        timers[k] += v
+    counters.update(worker_counters)
+
+
+def parse_args(description):
+    return arg_parser(description).parse_args()
+
+
+def arg_parser(description):
+    # for the scripts that add arguments of their own
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--report', metavar='JSON', help='write the stage timers and counters to JSON')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='profile the run into FILE: cProfile stats, or a pyinstrument page if FILE ends in .html')
+    return parser
+
+
+@contextmanager
+def instrumented(script, report=None, profile=None):
+    """
+    Runs the block of an entry script, optionally under a profiler, and writes the JSON report if asked to.
+    """
+    profiler = None
+    if profile and Path(profile).suffix == '.html':
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+    elif profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    started = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall_time = time.perf_counter() - start
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            profiler.dump_stats(profile)
+        elif profiler is not None:
+            profiler.stop()
+            Path(profile).write_text(profiler.output_html(), encoding='utf8')
+        if report:
+            write_report(report, script, started, wall_time)
+
+
+def write_report(report_file, script, started, wall_time):
+    # stages run in pool workers are summed over the workers, so they can add up to more than wall_time
+    content = {
+        'script': script,
+        'argv': sys.argv[1:],
+        'started': started.isoformat(timespec='seconds'),
+        'wall_time': round(wall_time, 6),
+        'stages': {k: round(v, 6) for k, v in sorted(timers.items())},
+        'counters': dict(sorted(counters.items())),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+    }
+    Path(report_file).write_text(json.dumps(content, ensure_ascii=False, indent=2), encoding='utf8')
@@ -0,0 +1,144 @@
+import argparse
+import json
+import sys
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pyewts
+
+from .fulltext import has_fulltext, search
+from .reader import iter_entries
+from .store import is_current, open_store
+
+converter = pyewts.pyewts()
+
+
+def normalize_key(word):
+    # headwords end with a tsek and/or shad depending on add_shad(): queries should match with or without them
+    return word.strip().rstrip('།་ ')
+
+
+class GlossaryIndex:
+    """
+    In-memory index of the merged glossary, answering exact and prefix headword queries.
+
+    Keys are normalized once when the index is built, so queries never go through botok.
+    """
+    def __init__(self, glossary_file):
+        self.entries = list(iter_entries(glossary_file))
+        self.exact = {}
+        for pos, (_, word, _) in enumerate(self.entries):
+            self.exact.setdefault(normalize_key(word), []).append(pos)
+        # codepoint order is enough to find the keys sharing a prefix with bisect
+        self.keys = sorted(self.exact)
+
+    def lookup(self, query, prefix=False, wylie=False, limit=50):
+        """
+        :param query: a headword, in Tibetan Unicode or in Wylie if wylie is True
+        :param prefix: return every headword starting with query instead of exact matches
+        :param limit: maximum number of entries returned
+        :return: a list of (num, word, entries), in glossary order
+        """
+        if wylie:
+            query = converter.toUnicode(query)
+        key = normalize_key(query)
+
+        if not prefix:
+            positions = self.exact.get(key, [])
+        else:
+            positions = []
+            i = bisect_left(self.keys, key)
+            while i < len(self.keys) and self.keys[i].startswith(key):
+                positions.extend(self.exact[self.keys[i]])
+                i += 1
+        return [self.entries[pos] for pos in sorted(positions)[:limit]]
+
+
+def serve(index, host='127.0.0.1', port=8000):
+    """
+    Serves GET /lookup?q=...&prefix=1&wylie=1 as JSON.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path != '/lookup' or 'q' not in params:
+                self.send_error(404, 'use /lookup?q=<headword>[&prefix=1][&wylie=1]')
+                return
+
+            found = index.lookup(params['q'][0],
+                                 prefix=params.get('prefix', ['0'])[0] == '1',
+                                 wylie=params.get('wylie', ['0'])[0] == '1')
+            body = json.dumps([{'num': num, 'word': word, 'entries': entries} for num, word, entries in found],
+                              ensure_ascii=False).encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f'serving {len(index.entries)} entries on http://{host}:{port}/lookup')
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Look up headwords in the merged glossary.')
+    parser.add_argument('query', nargs='?', help='headword to look up')
+    parser.add_argument('--glossary', default='content/glossary.json', help='glossary.json or glossary.sqlite')
+    parser.add_argument('--prefix', action='store_true', help='match every headword starting with the query')
+    parser.add_argument('--wylie', action='store_true', help='the query is in Wylie')
+    parser.add_argument('--search', action='store_true',
+                        help='search the definitions of glossary.sqlite instead of the headwords')
+    parser.add_argument('--serve', type=int, metavar='PORT', help='answer queries over HTTP on PORT')
+    args = parser.parse_args()
+
+    if args.search:
+        search_definitions(args.query, args.glossary, parser)
+        return
+
+    index = GlossaryIndex(args.glossary)
+    if args.serve:
+        serve(index, port=args.serve)
+        return
+    if not args.query:
+        parser.error('a query is needed unless --serve is given')
+
+    start = time.perf_counter()
+    found = index.lookup(args.query, prefix=args.prefix, wylie=args.wylie)
+    elapsed = time.perf_counter() - start
+    for num, word, entries in found:
+        print(f'{num} {word}')
+        for name, defs in entries:
+            for defnt in defs:
+                print(f'    {name}: {defnt}')
+    print(f'{len(found)} entries in {elapsed * 1000:.3f} ms')
+
+
+def search_definitions(query, glossary_file, parser):
+    store_file = Path(glossary_file).with_suffix('.sqlite')
+    if not query:
+        parser.error('--search needs a query')
+    if not store_file.is_file():
+        parser.error(f'{store_file} not found: run parse_glossaries first')
+    if Path(glossary_file).suffix == '.json' and not is_current(store_file, glossary_file):
+        print(f'warning: {store_file} was not written with the current {glossary_file}: run parse_glossaries',
+              file=sys.stderr)
+    db = open_store(store_file)
+    if not has_fulltext(db):
+        parser.error(f'{store_file} has no full-text index: run parse_glossaries with fulltext=True')
+
+    start = time.perf_counter()
+    found = search(db, query)
+    elapsed = time.perf_counter() - start
+    for score, num, word in found:
+        print(f'{score:6.2f} {num} {word}')
+    print(f'{len(found)} entries in {elapsed * 1000:.3f} ms')
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import hashlib
+import sqlite3
+from functools import lru_cache
+from importlib.metadata import version
+from pathlib import Path
+
+import pyewts
+from botok import TokChunks
+
+from .instrument import stage, count
+
+converter = pyewts.pyewts()
+
+# cached normalizations are only valid for the converter/tokenizer and the code of this module
+# (add_shad...) that produced them
+normalizer = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+versions = f'pyewts {version("pyewts")}, botok {version("botok")}, normalize {normalizer}'
+stats = {'lookups': 0, 'disk_hits': 0, 'tokenized': 0}
+disk = None
+# normalizations missing from the disk cache, while one is open: see take_normalized()
+normalized = None
+
+
+def normalize_word(word):
+    """
+    Converts a Wylie (or Unicode) headword to its normalized Unicode form:
+    toUnicode, then cleanup by TokChunks, then add_shad.
+    """
+    stats['lookups'] += 1
+    return _normalize(word)
+
+
+@lru_cache(maxsize=50000)
+def _normalize(word):
+    if disk is not None:
+        found = disk.execute('SELECT norm FROM normalized WHERE wylie = ? AND versions = ?',
+                             (word, versions)).fetchone()
+        if found:
+            stats['disk_hits'] += 1
+            return found[0]
+
+    stats['tokenized'] += 1
+    count('conversions')
+    with stage('convert'):
+        norm = converter.toUnicode(word)
+    with stage('tokenize'):
+        norm = '་'.join(TokChunks(norm).get_syls())
+    norm = add_shad(norm)
+
+    if normalized is not None:
+        normalized.append((word, versions, norm))
+    return norm
+
+
+def open_cache(cache_file):
+    """
+    Opens the disk cache read-only: pool workers share it without ever waiting for each other's locks.
+    What is normalized meanwhile is collected for save_cache(), called once by the parent process.
+    """
+    global disk, normalized
+    close_cache()
+    if not cache_file:
+        return
+    normalized = []
+    if Path(cache_file).is_file():
+        disk = sqlite3.connect(f'file:{Path(cache_file).resolve()}?mode=ro', uri=True, timeout=60)
+
+
+def take_normalized():
+    """
+    :return: the (wylie, versions, norm) normalized since open_cache() or the last call, for save_cache()
+    """
+    global normalized
+    taken = normalized or []
+    if normalized is not None:
+        normalized = []
+    return taken
+
+
+def close_cache():
+    global disk, normalized
+    if disk is not None:
+        disk.close()
+        disk = None
+    normalized = None
+
+
+def save_cache(cache_file, rows):
+    """
+    Adds the rows of take_normalized() to the disk cache, in a single transaction.
+    """
+    if not cache_file or not rows:
+        return
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(cache_file, timeout=60)
+    db.execute('CREATE TABLE IF NOT EXISTS normalized '
+               '(wylie TEXT, versions TEXT, norm TEXT, PRIMARY KEY (wylie, versions))')
+    with db:
+        db.executemany('INSERT OR REPLACE INTO normalized VALUES (?, ?, ?)', rows)
+    db.close()
+
+
+def cache_report(stats=stats):
+    lookups = stats['lookups']
+    tokenized = stats['tokenized']
+    hit_rate = (lookups - tokenized) / lookups * 100 if lookups else 0
+    return (f'normalization cache: {lookups} lookups, {hit_rate:.1f}% hits '
+            f'({stats["disk_hits"]} from disk, {tokenized} tokenized)')
+
+
+def add_shad(word):
+    if word.endswith('ང'):
+        return word + '་།'
+    elif word[-1] in ['ཀ', 'ག', 'ཤ']:
+        return word
+    else:
+        return word + '།'
@@ -0,0 +1,87 @@
+import json
+from itertools import islice
+from pathlib import Path
+
+from .store import open_store, iter_store
+
+decoder = json.JSONDecoder()
+
+
+def iter_entries(glossary_file, first=0, last=None):
+    """
+    Yields the (num, word, entries) of the positions first to last (excluded) in sort order,
+    from glossary.json or from the glossary.sqlite store written next to it.
+    """
+    if Path(glossary_file).suffix == '.sqlite':
+        db = open_store(glossary_file)
+        try:
+            yield from iter_store(db, first, last)
+        finally:
+            db.close()
+    else:
+        yield from islice(iter_glossary(glossary_file), first, last)
+
+
+def iter_glossary(json_file, chunk_size=1 << 16):
+    """
+    Streams the entries of glossary.json in file order, without loading the whole file.
+
+    :param json_file: the glossary written by parse_glossaries
+    :param chunk_size: how many characters are read at a time
+    :return: a generator of (num, word, entries) tuples
+    """
+    with open(json_file, encoding='utf8') as f:
+        buf = ''
+        pos = 0
+
+        def next_char():
+            # position of the next significant character, reading more of the file when needed
+            nonlocal buf, pos
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                buf, pos = f.read(chunk_size), 0
+                if not buf:
+                    raise ValueError(f'{json_file}: unexpected end of file')
+
+        def decode():
+            nonlocal buf, pos
+            next_char()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    more = f.read(chunk_size)
+                    if not more:
+                        raise
+                    buf, pos = buf[pos:] + more, 0
+                    continue
+                # a number could be cut short at the end of the buffer, so make sure something follows
+                if end == len(buf):
+                    more = f.read(chunk_size)
+                    if more:
+                        buf, pos = buf[pos:] + more, 0
+                        continue
+                pos = end
+                return value
+
+        def expect(chars):
+            nonlocal pos
+            c = next_char()
+            if c not in chars:
+                raise ValueError(f'{json_file}: expected {chars!r}, found {c!r}')
+            pos += 1
+            return c
+
+        expect('{')
+        if next_char() == '}':
+            return
+        while True:
+            num = decode()
+            expect(':')
+            word, entries = decode()
+            yield int(num), word, entries
+            if expect(',}') == '}':
+                return
@@ -0,0 +1,98 @@
+import json
+from bisect import bisect_right
+from importlib.metadata import version
+from pathlib import Path
+
+from tibetan_sort import TibetanSort
+
+sorter = TibetanSort()
+sorter_version = f'tibetan_sort {version("tibetan_sort")}'
+
+
+def sort_key(word):
+    """
+    Key equivalent to TibetanSort.compare(): the (primary, secondary) weights of the successive longest
+    matches in the sorter's trie, flattened into a list of ints.
+    """
+    if sorter.trie is None:
+        sorter._build_trie()
+
+    key = []
+    offset = 0
+    while True:
+        nb_chars, primary, secondary = sorter._get_longest_match(word, offset)
+        if nb_chars < 1:
+            return key
+        key.extend([primary, secondary])
+        offset += nb_chars
+
+
+def sort_words(words, index_file=None):
+    """
+    Sorts words the way sorter.sort_list() does.
+
+    If index_file is given, it holds the previous ordered index with the sort key of every word.
+    Words that were already indexed keep their order, new words are bisected in and the updated
+    index is written back.
+    """
+    index = load_index(index_file)
+    words = list(dict.fromkeys(words))
+    present = set(words)
+    ordered = [w for w in index if w in present]
+    keys = [index[w] for w in ordered]
+    new = [w for w in words if w not in index]
+
+    if len(new) > len(ordered):
+        # mostly new words: a plain sort is cheaper than repeated insertions
+        new_keys = {w: sort_key(w) for w in new}
+        both = {**{w: k for w, k in zip(ordered, keys)}, **new_keys}
+        ordered = sorted(words, key=both.__getitem__)
+        keys = [both[w] for w in ordered]
+    else:
+        for word in new:
+            key = sort_key(word)
+            pos = bisect_right(keys, key)
+            keys.insert(pos, key)
+            ordered.insert(pos, word)
+
+    save_index(dict(zip(ordered, keys)), index_file)
+    return ordered
+
+
+def load_index(index_file):
+    if not index_file or not Path(index_file).is_file():
+        return {}
+    index = json.loads(Path(index_file).read_text(encoding='utf8'))
+    if index.get('version') != sorter_version:
+        return {}
+    return index['keys']
+
+
+def save_index(index, index_file):
+    if not index_file:
+        return
+    content = {'version': sorter_version, 'keys': index}
+    Path(index_file).parent.mkdir(parents=True, exist_ok=True)
+    Path(index_file).write_text(json.dumps(content, ensure_ascii=False), encoding='utf8')
+
+
+def number_words(sorted_words, previous=None):
+    """
+    Numbers the sorted words from 1.
+
+    With previous, a {word: num} mapping from an earlier run, the words that were already numbered
+    keep their num and new words are numbered after the highest previous num. Numbers are then
+    no longer in sort order, so consumers have to follow the order of the entries, not their numbers.
+    """
+    if previous is None:
+        return {word: num + 1 for num, word in enumerate(sorted_words)}
+
+    next_num = max(previous.values(), default=0) + 1
+    numbers = {}
+    for word in sorted_words:
+        if word in previous:
+            numbers[word] = previous[word]
+        else:
+            numbers[word] = next_num
+            next_num += 1
+    return numbers
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from .fulltext import build_fulltext
+
+
+def write_store(total, store_file, fulltext=False, json_file=None):
+    """
+    Writes the merged glossary to an indexed SQLite file next to glossary.json.
+
+    Every row keeps the entry number, its position in sort order, the headword and the entries as
+    compact JSON, so that consumers only decode the rows they read.
+
+    :param total: {num: (word, entries)} in sort order, as written to glossary.json
+    :param store_file: path of the .sqlite file
+    :param fulltext: also index the words of the definitions, see fulltext.search()
+    :param json_file: the glossary.json written from total, whose hash is kept for is_current()
+    """
+    store_file = Path(store_file)
+    tmp_file = store_file.with_name(f'.{store_file.name}.tmp')
+    tmp_file.unlink(missing_ok=True)
+
+    db = sqlite3.connect(tmp_file)
+    db.execute('CREATE TABLE entries (num INTEGER PRIMARY KEY, pos INTEGER NOT NULL, word TEXT NOT NULL, '
+               'entries TEXT NOT NULL)')
+    db.executemany('INSERT INTO entries VALUES (?, ?, ?, ?)',
+                   ((num, pos, word, json.dumps(entries, ensure_ascii=False, separators=(',', ':')))
+                    for pos, (num, (word, entries)) in enumerate(total.items())))
+    db.execute('CREATE UNIQUE INDEX entries_pos ON entries (pos)')
+    db.execute('CREATE UNIQUE INDEX entries_word ON entries (word)')
+    db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    if json_file:
+        db.execute("INSERT INTO meta VALUES ('json_sha256', ?)", (file_hash(json_file),))
+    if fulltext:
+        build_fulltext(db, total)
+    db.commit()
+    db.execute('VACUUM')
+    db.close()
+    os.replace(tmp_file, store_file)
+
+
+def is_current(store_file, json_file):
+    """
+    Whether store_file was written along with json_file as it is now. glossary.json is committed and
+    the store is not, so a pull or a hand edit of glossary.json leaves the store behind.
+    """
+    if not Path(store_file).is_file():
+        return False
+    db = open_store(store_file)
+    try:
+        row = db.execute("SELECT value FROM meta WHERE key = 'json_sha256'").fetchone()
+    except sqlite3.OperationalError:
+        # written before the hash was kept
+        return False
+    finally:
+        db.close()
+    return row is not None and row[0] == file_hash(json_file)
+
+
+def file_hash(in_file):
+    return hashlib.sha256(Path(in_file).read_bytes()).hexdigest()
+
+
+def open_store(store_file):
+    # read-only and memory-mapped: opening is cheap and nothing is loaded before it is queried
+    db = sqlite3.connect(f'file:{Path(store_file).resolve()}?mode=ro', uri=True)
+    db.execute('PRAGMA mmap_size = 268435456')
+    return db
+
+
+def lookup_num(db, num):
+    row = db.execute('SELECT num, word, entries FROM entries WHERE num = ?', (num,)).fetchone()
+    return decode(row) if row else None
+
+
+def lookup_word(db, word):
+    row = db.execute('SELECT num, word, entries FROM entries WHERE word = ?', (word,)).fetchone()
+    return decode(row) if row else None
+
+
+def iter_store(db, first=0, last=None):
+    """
+    Yields the (num, word, entries) of the positions first to last (excluded) in sort order.
+    """
+    if last is None:
+        rows = db.execute('SELECT num, word, entries FROM entries WHERE pos >= ? ORDER BY pos', (first,))
+    else:
+        rows = db.execute('SELECT num, word, entries FROM entries WHERE pos >= ? AND pos < ? ORDER BY pos',
+                          (first, last))
+    for row in rows:
+        yield decode(row)
+
+
+def iter_words(db):
+    for word, in db.execute('SELECT word FROM entries ORDER BY pos'):
+        yield word
+
+
+def decode(row):
+    num, word, entries = row
+    return num, word, json.loads(entries)
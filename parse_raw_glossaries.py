@@ -1,6 +1,17 @@
+import os
+import sys
+
 from glossary import parse_glossaries
+from glossary.instrument import parse_args, instrumented
 
 
+args = parse_args('Merge the raw glossaries and spreadsheets into content/glossary.json.')
 in_path = 'content'
 out_path = 'content'
-parse_glossaries(in_path, out_path)
+cache_path = 'content/.cache'
+with instrumented('parse_raw_glossaries', args.report, args.profile):
+    diagnostics = parse_glossaries(in_path, out_path, cache_path, workers=os.cpu_count(), duplicates=True,
+                                   fulltext=True)
+# glossary.json is written without the malformed lines: fail the run until they are fixed
+if diagnostics:
+    sys.exit(1)